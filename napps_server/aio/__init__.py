@@ -0,0 +1 @@
+"""Package with the asyncio (ASGI) variant of napps-server."""
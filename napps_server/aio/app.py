@@ -0,0 +1,370 @@
+"""Module with the factory of the napps-server asyncio (ASGI) application.
+
+The read endpoints of auth, users and napps are served natively, with an
+asyncio redis client, so a single process handles many concurrent requests.
+Every other route (uploads, registration, confirmation, autocomplete...) is
+served by the Flask application, run in a pool of threads.
+
+Run it with any ASGI server, e.g.::
+
+    uvicorn --factory napps_server.aio.app:create_app
+"""
+import base64
+import binascii
+import contextlib
+import os
+import re
+import time
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, Response
+from starlette.routing import Match, Mount, Route
+
+from napps_server import config
+from napps_server.aio import models
+from napps_server.core import credentials, metrics, serialization, storage
+from napps_server.core.exceptions import (CredentialsTimeout,
+                                          NappsEntryDoesNotExists)
+from napps_server.core.utils import get_pagination
+
+
+def json_response(obj, status=200, headers=None):
+    """Method used to answer with a value encoded as JSON."""
+    return Response(serialization.dumps(obj), status, headers,
+                    media_type=serialization.MIMETYPE)
+
+
+def _limit_error():
+    """Answer a request whose limit is invalid."""
+    return json_response({'error': 'limit must be a positive integer'}, 400)
+
+
+def _authenticate():
+    """Answer with a 401 that enables basic auth."""
+    return Response('Could not verify your access level for that URL.\n'
+                    'You have to login with proper credentials', 401,
+                    {'WWW-Authenticate': 'Basic realm="Login Required"'})
+
+
+def _unavailable():
+    """Answer with a 503 when the credentials can't be verified in time."""
+    return Response('Too many authentication requests, try again later.',
+                    503, {'Retry-After': str(config.BCRYPT_RETRY_AFTER)})
+
+
+def _basic_auth(request):
+    """Return the username and password of the request, if any."""
+    scheme, _, value = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        decoded = base64.b64decode(value).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    username, separator, password = decoded.partition(':')
+    return (username, password) if separator else None
+
+
+def _etag_matches(request, etag):
+    """Check if the client already has the representation of the etag."""
+    etags = request.headers.get('if-none-match', '')
+    return any(value.strip().strip('"') == etag or value.strip() == '*'
+               for value in etags.split(','))
+
+
+async def napps_auth(request):
+    """Endpoint to perform the authentication (GET /auth/).
+
+    bcrypt runs in its pool of workers, awaited by the event loop.
+    """
+    auth = _basic_auth(request)
+    if auth is None:
+        return _authenticate()
+    db = request.app.state.db
+    try:
+        user = await models.get_user(db, auth[0])
+    except NappsEntryDoesNotExists:
+        return _authenticate()
+    try:
+        if not await credentials.check_password_async(auth[0], auth[1],
+                                                      user.password):
+            return _authenticate()
+    except CredentialsTimeout:
+        return _unavailable()
+    token = await models.create_token(db, user)
+    return json_response(token.as_dict(), 201)
+
+
+async def check_token(request):
+    """Enpoint to check user authentication token (POST /auth/verify/)."""
+    if request.headers.get('content-type', '').startswith(
+            'application/json'):
+        token = (await request.json() or {}).get('token')
+    else:
+        token = (await request.form()).get('token')
+    try:
+        if not token:
+            raise NappsEntryDoesNotExists
+        username = await models.token_owner(request.app.state.db, token)
+    except NappsEntryDoesNotExists:
+        return _authenticate()
+    msg = 'User {} authorization correctly verified'.format(username)
+    return Response(msg, 201)
+
+
+async def get_users(request):
+    """Method used to show all applications developers (GET /users/)."""
+    try:
+        cursor, limit = get_pagination(request.query_params)
+    except ValueError:
+        return _limit_error()
+
+    db = request.app.state.db
+    if limit is None:
+        users = await models.all_users(db)
+        return json_response({'users': {user.username: user.as_dict()
+                                        for user in users}})
+
+    page, next_cursor = await models.users_page(db, cursor, limit)
+    return json_response({'users': {user.username: user.as_dict()
+                                    for user in page},
+                          'next_cursor': next_cursor})
+
+
+async def get_user(request):
+    """Method used to show details about a user (GET /users/<username>/)."""
+    try:
+        user = await models.get_user(request.app.state.db,
+                                     request.path_params['username'])
+    except NappsEntryDoesNotExists:
+        return json_response({'error': 'User not found'}, 404)
+    return json_response(user.as_dict())
+
+
+async def get_napps(request):
+    """Method used to shows all network applications (GET /napps/).
+
+    Pages are served when a 'limit' or a 'cursor' is given, otherwise the
+    catalog snapshot is served with its ETag.
+    """
+    try:
+        cursor, limit = get_pagination(request.query_params)
+    except ValueError:
+        return _limit_error()
+
+    db = request.app.state.db
+    if limit is not None:
+        page, next_cursor = await models.napps_page(db, cursor, limit)
+        return json_response({'napps': [napp.as_dict() for napp in page],
+                              'next_cursor': next_cursor})
+
+    known = request.headers.get('if-none-match', '').strip().strip('"')
+    etag, body = await models.catalog(db, known or None)
+    headers = {'ETag': '"{}"'.format(etag)}
+    if body is None or _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, 200, headers, media_type=serialization.MIMETYPE)
+
+
+async def search_napps(request):
+    """Method used to search network applications (GET /napps/search/)."""
+    try:
+        limit = int(request.query_params.get('limit', config.SEARCH_LIMIT))
+        if limit <= 0:
+            raise ValueError
+    except ValueError:
+        return _limit_error()
+
+    napps = await models.search_napps(request.app.state.db,
+                                      request.query_params.get('q', ''),
+                                      min(limit, config.MAX_PAGE_SIZE))
+    return json_response({'napps': [napp.as_dict() for napp in napps]})
+
+
+async def get_napp(request):
+    """Method used to show the napps of a user, or one of them.
+
+    The napp and its owner are fetched concurrently.
+    """
+    username = request.path_params['username']
+    name = request.path_params.get('name')
+    db = request.app.state.db
+
+    if not name:
+        try:
+            napps = await models.user_napps(db, username)
+        except NappsEntryDoesNotExists:
+            return json_response({
+                'error': 'Username {} not found'.format(username)}, 404)
+        return json_response([napp.as_dict() for napp in napps])
+
+    try:
+        napp = await models.get_napp(db, username, name)
+    except NappsEntryDoesNotExists:
+        if await db.exists("user:%s" % username):
+            msg = 'NApp {} not found for the username {}'.format(name,
+                                                                 username)
+        else:
+            msg = 'Username {} not found'.format(username)
+        return json_response({'error': msg}, 404)
+    return json_response(napp.as_dict())
+
+
+async def get_napp_versions(request):
+    """Method used to list the versions of a napp."""
+    username = request.path_params['username']
+    name = request.path_params['name']
+    versions = await models.list_versions(request.app.state.db, username,
+                                          name)
+    if not versions:
+        return json_response({
+            'error': 'No versions found for the NApp {}/{}'.format(username,
+                                                                  name)
+        }, 404)
+    return json_response({'versions': versions})
+
+
+async def download_napp(request):
+    """Method used to download a .napp file.
+
+    See :func:`napps_server.api.napps.download_napp`.
+    """
+    username = request.path_params['username']
+    name = request.path_params['name']
+    version = request.path_params.get('version')
+    found = await models.resolve_version(request.app.state.db, username, name,
+                                         version)
+    if found is None:
+        return json_response({
+            'error': 'Version not found for the NApp {}/{}'.format(username,
+                                                                  name)
+        }, 404)
+
+    # A given version never changes, the latest one must be revalidated.
+    max_age = config.DOWNLOAD_MAX_AGE if version else 0
+    headers = {'ETag': '"{}"'.format(found['digest']),
+               'Cache-Control': 'max-age={}'.format(max_age)}
+    if _etag_matches(request, found['digest']):
+        return Response(status_code=304, headers=headers)
+
+    if config.DOWNLOAD_ACCEL_REDIRECT:
+        blob = os.path.relpath(found['path'], storage.blobs_dir())
+        headers['X-Accel-Redirect'] = config.DOWNLOAD_ACCEL_REDIRECT + blob
+        headers['Content-Disposition'] = \
+            'attachment; filename="{}"'.format(found['filename'])
+        return Response(headers=headers,
+                        media_type='application/octet-stream')
+
+    response = FileResponse(found['path'], headers=headers,
+                            media_type='application/octet-stream',
+                            filename=found['filename'])
+    # The digest is a better validator than the default one, based on mtime.
+    response.headers['ETag'] = headers['ETag']
+    return response
+
+
+ROUTES = [
+    Route('/auth/', napps_auth, methods=['GET']),
+    Route('/auth/verify/', check_token, methods=['POST']),
+    Route('/users/', get_users, methods=['GET']),
+    Route('/users/{username}/', get_user, methods=['GET']),
+    Route('/napps/', get_napps, methods=['GET']),
+    Route('/napps/search', search_napps, methods=['GET']),
+    Route('/napps/search/', search_napps, methods=['GET']),
+    Route('/napps/{username}/', get_napp, methods=['GET']),
+    Route('/napps/{username}/{name}/', get_napp, methods=['GET']),
+    Route('/napps/{username}/{name}/versions/', get_napp_versions,
+          methods=['GET']),
+    Route('/napps/{username}/{name}/download/', download_napp,
+          methods=['GET']),
+    Route('/napps/{username}/{name}/download/{version}', download_napp,
+          methods=['GET']),
+]
+
+
+class Metrics(object):
+    """ASGI middleware recording the requests served by ROUTES.
+
+    Requests are labelled like the Flask routes (e.g. '/users/<username>/'),
+    and the other requests are recorded by the Flask application.
+    """
+
+    def __init__(self, app, routes):
+        """Constructor of Metrics class.
+
+        Parameters:
+            app: The ASGI application.
+            routes (list): Routes whose requests are recorded.
+        """
+        self.app = app
+        self.routes = [(route, re.sub(r'{(\w+)}', r'<\1>', route.path))
+                       for route in routes]
+
+    def _route(self, scope):
+        """Return the label of the route of a request, or None."""
+        for route, label in self.routes:
+            if route.matches(scope)[0] == Match.FULL:
+                return label
+        return None
+
+    async def __call__(self, scope, receive, send):
+        """Record the duration, status and size of the response."""
+        route = self._route(scope) if scope['type'] == 'http' else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        response = {'status': 500, 'size': 0}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                response['size'] += len(message.get('body', b''))
+            await send(message)
+
+        metrics.registry.start()
+        metrics.requests_in_flight.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.observe_request(scope['method'], route,
+                                    response['status'],
+                                    time.perf_counter() - started_at,
+                                    response['size'])
+            metrics.requests_in_flight.dec()
+
+
+def create_app(flask_app=None, wsgi_workers=10):
+    """Method used to create the napps-server asyncio application.
+
+    Parameters:
+        flask_app (:class:`flask.Flask`): Application serving the other
+            routes. Created with :func:`napps_server.app.create_app` if not
+            given.
+        wsgi_workers (int): Threads running the Flask application.
+
+    Returns:
+        app (:class:`starlette.applications.Starlette`): The application.
+    """
+    if flask_app is None:
+        from napps_server.app import create_app as create_flask_app
+        flask_app = create_flask_app()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        app.state.db = config.DB_CON.async_client()
+        try:
+            yield
+        finally:
+            await app.state.db.aclose()
+
+    # Requests not matched by ROUTES (e.g. POST /napps/) fall to Flask.
+    routes = ROUTES + [Mount('/', app=WSGIMiddleware(flask_app,
+                                                     workers=wsgi_workers))]
+    app = Starlette(routes=routes, lifespan=lifespan)
+    if config.METRICS_ENABLED:
+        app.add_middleware(Metrics, routes=ROUTES)
+    return app
@@ -0,0 +1,363 @@
+"""Module with the asyncio access to the napps-server models.
+
+The functions mirror the methods of :mod:`napps_server.core.models` used by
+the read endpoints, with an asyncio redis client. They build the same model
+instances and share the in-process cache of users, and run the CPU-bound work
+(docutils, bcrypt) in executors. Independent lookups run concurrently.
+"""
+import asyncio
+import re
+import uuid
+from datetime import datetime
+
+from napps_server import config
+from napps_server.core import metrics, readme, search, storage
+from napps_server.core.exceptions import NappsEntryDoesNotExists
+from napps_server.core.models import (Catalog, Napp, Token, User, user_cache,
+                                      user_invalidator)
+
+
+async def index_page(db, index, prefix, cursor=None, limit=None):
+    """Method used to read a page of a lexicographically ordered index.
+
+    See :func:`napps_server.core.models._index_page`.
+
+    Returns:
+        page (tuple): List of members and the cursor of the next page, which
+                      is None if this is the last one.
+    """
+    start = '(' + prefix + cursor if cursor else '-'
+    if limit:
+        members = await db.zrangebylex(index, start, '+', 0, limit + 1)
+    else:
+        members = await db.zrangebylex(index, start, '+')
+
+    next_cursor = None
+    if limit and len(members) > limit:
+        members = members[:limit]
+        next_cursor = members[-1][len(prefix):]
+    return members, next_cursor
+
+
+async def rebuild_stale_index(db, members, index, rebuild):
+    """Method used to rebuild an ordered index that differs from its set.
+
+    See :func:`napps_server.core.models._index_is_stale`. The index is
+    rebuilt in the default executor, with the synchronous models.
+    """
+    pipe = db.pipeline(transaction=False)
+    pipe.scard(members)
+    pipe.zcard(index)
+    count, indexed = await pipe.execute()
+    if count != indexed:
+        await asyncio.get_running_loop().run_in_executor(None, rebuild)
+
+
+async def get_users(db, usernames):
+    """Method used to get several users in a single round trip.
+
+    Parameters:
+        db (:class:`redis.asyncio.Redis`): Redis client.
+        usernames (iterable): Usernames of users registered.
+
+    Returns:
+        users (dict): Users found, indexed by username.
+    """
+    user_invalidator.listen()
+    users = {}
+    missing = []
+    for username in set(usernames):
+        attributes = user_cache.get(username)
+        if attributes is None:
+            missing.append(username)
+        else:
+            users[username] = User._from_redis(attributes)
+    if not missing:
+        return users
+
+    generation = user_cache.generation
+    pipe = db.pipeline(transaction=False)
+    for username in missing:
+        pipe.hgetall("user:%s" % username)
+    for username, attributes in zip(missing, await pipe.execute()):
+        if attributes:
+            user_cache.set(username, attributes, generation)
+            users[username] = User._from_redis(attributes)
+    return users
+
+
+async def get_user(db, username):
+    """Method used to get a user of a given username.
+
+    Returns:
+        user (:class:`napps_server.core.models.User`): The user.
+    Raises:
+        NappsEntryDoesNotExists: If the user is not registered.
+    """
+    metrics.count('User.get')
+    users = await get_users(db, [username])
+    if username not in users:
+        raise NappsEntryDoesNotExists("User {} not found.".format(username))
+    return users[username]
+
+
+async def all_users(db):
+    """Method used to return all users registered."""
+    metrics.count('User.all')
+    keys = await db.smembers('users')
+    users = await get_users(db, [re.sub(r'^user:', '', key) for key in keys])
+    return list(users.values())
+
+
+async def users_page(db, cursor=None, limit=None):
+    """Method used to return a page of users ordered by username.
+
+    Returns:
+        page (tuple): List of users and the cursor of the next page.
+    """
+    if not cursor:
+        await rebuild_stale_index(db, 'users', 'users:index',
+                                  User.rebuild_index)
+    keys, next_cursor = await index_page(db, 'users:index', 'user:', cursor,
+                                         limit)
+    usernames = [re.sub(r'^user:', '', key) for key in keys]
+    users = await get_users(db, usernames)
+    return [users[name] for name in usernames if name in users], next_cursor
+
+
+async def readme_html(db, napp_key, source, cached):
+    """Method used to get the rendered html of a README.
+
+    Stale entries are rendered by docutils in the default executor.
+
+    Returns:
+        readme_html (string): The rendered html.
+    """
+    digest = readme.readme_hash(source)
+    if cached and cached.get('hash') == digest:
+        return cached['html']
+    html = await asyncio.get_running_loop().run_in_executor(
+        None, readme.render, source)
+    await db.hset(readme.readme_key(napp_key),
+                  mapping={'hash': digest, 'html': html})
+    return html
+
+
+async def _fetch_napps(db, keys):
+    """Fetch the hashes and cached READMEs of napps in one round trip."""
+    pipe = db.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+        pipe.hgetall(readme.readme_key(key))
+    results = await pipe.execute()
+    return results[0::2], results[1::2]
+
+
+async def _build_napps(db, keys, contents, readmes, users):
+    """Build the napps whose owner is known, rendering stale READMEs."""
+    napps, pending = [], []
+    for key, content, cached in zip(keys, contents, readmes):
+        username = content.get('username', content.get('author'))
+        if not content or username not in users:
+            continue
+        napp = Napp(content, users[username])
+        napps.append(napp)
+        pending.append(readme_html(db, key, napp.readme_rst, cached))
+    for napp, html in zip(napps, await asyncio.gather(*pending)):
+        napp._readme_html = html
+    return napps
+
+
+async def get_napps(db, keys, users=None):
+    """Method used to load several napps in a fixed number of round trips.
+
+    See :meth:`napps_server.core.models.Napp.get_many`.
+
+    Returns:
+        napps (list): Napps found whose owner exists.
+    """
+    metrics.count('Napp.get_many')
+    keys = list(keys)
+    contents, readmes = await _fetch_napps(db, keys)
+    users = dict(users or {})
+    usernames = {content.get('username', content.get('author'))
+                 for content in contents if content}
+    users.update(await get_users(db, usernames.difference(users)))
+    return await _build_napps(db, keys, contents, readmes, users)
+
+
+async def get_napp(db, username, name):
+    """Method used to get a napp and its owner, fetched concurrently.
+
+    Returns:
+        napp (:class:`napps_server.core.models.Napp`): The napp.
+    Raises:
+        NappsEntryDoesNotExists: If the user or the napp does not exist.
+    """
+    key = "napp:{}/{}".format(username, name)
+    user, (contents, readmes) = await asyncio.gather(
+        get_user(db, username), _fetch_napps(db, [key]))
+    napps = await _build_napps(db, [key], contents, readmes,
+                               {username: user})
+    if not napps:
+        msg = "Napp {} not found for user {}.".format(name, username)
+        raise NappsEntryDoesNotExists(msg)
+    return napps[0]
+
+
+async def user_napps(db, username):
+    """Method used to get a user and all its napps.
+
+    Returns:
+        napps (list): Napps of the user.
+    Raises:
+        NappsEntryDoesNotExists: If the user does not exist.
+    """
+    user, keys = await asyncio.gather(
+        get_user(db, username), db.smembers("user:%s:napps" % username))
+    return await get_napps(db, keys, {username: user})
+
+
+async def napps_page(db, cursor=None, limit=None):
+    """Method used to return a page of napps ordered by name.
+
+    Returns:
+        page (tuple): List of napps and the cursor of the next page.
+    """
+    if not cursor:
+        await rebuild_stale_index(db, 'napps', 'napps:index',
+                                  Napp.rebuild_index)
+    keys, next_cursor = await index_page(db, 'napps:index', 'napp:', cursor,
+                                         limit)
+    return await get_napps(db, keys), next_cursor
+
+
+async def search_napps(db, query, limit=None):
+    """Method used to search napps matching every term of a query.
+
+    See :func:`napps_server.core.search.search`.
+
+    Returns:
+        napps (list): Napps found, most relevant first.
+    """
+    limit = limit or config.SEARCH_LIMIT
+    terms = sorted(set(search.tokenize(query)))
+    if not terms:
+        return []
+    if len(terms) == 1:
+        keys = await db.zrevrange(search.term_key(terms[0]), 0, limit - 1)
+    else:
+        result_key = "search:result:{}".format(uuid.uuid4().hex)
+        pipe = db.pipeline(transaction=False)
+        pipe.zinterstore(result_key, [search.term_key(term)
+                                      for term in terms])
+        pipe.expire(result_key, search.RESULT_TTL)
+        pipe.zrevrange(result_key, 0, limit - 1)
+        pipe.delete(result_key)
+        keys = (await pipe.execute())[2]
+    return await get_napps(db, keys)
+
+
+async def list_versions(db, username, name):
+    """Method used to list the versions of a napp, latest first.
+
+    See :func:`napps_server.core.storage.list_versions`.
+    """
+    filenames = await db.zrevrange(storage.versions_key(username, name), 0,
+                                   -1)
+    pipe = db.pipeline(transaction=False)
+    for filename in filenames:
+        pipe.hgetall(storage.version_key(username, name, filename))
+    return [storage._parse_version(version)
+            for version in await pipe.execute() if version]
+
+
+async def resolve_version(db, username, name, filename=None):
+    """Method used to find a version of a napp.
+
+    See :func:`napps_server.core.storage.resolve`.
+
+    Returns:
+        version (dict): The version with its blob path, or None.
+    """
+    key = storage.versions_key(username, name)
+    if filename is None:
+        found = await db.zrevrange(key, 0, 0)
+    elif filename.isdigit():
+        found = await db.zrangebyscore(key, filename, filename)
+    else:
+        found = [filename]
+    if not found:
+        return None
+    version = await db.hgetall(storage.version_key(username, name, found[0]))
+    if not version:
+        return None
+    version = storage._parse_version(version)
+    version['path'] = storage.blob_path(version['digest'])
+    return version
+
+
+async def catalog(db, etag=None):
+    """Method used to get the current catalog snapshot.
+
+    See :meth:`napps_server.core.models.Catalog.get`. A stale snapshot is
+    rebuilt in the default executor, with the synchronous models, unless
+    another process is rebuilding it.
+
+    Returns:
+        snapshot (tuple): The ETag and the JSON body of the snapshot. The
+                          body is None if the given etag is still current.
+    """
+    pipe = db.pipeline(transaction=False)
+    pipe.get(Catalog.version_key)
+    pipe.hmget(Catalog.snapshot_key, 'version', 'etag', 'body')
+    version, (snapshot_version, snapshot_etag, body) = await pipe.execute()
+    version = version or '0'
+
+    loop = asyncio.get_running_loop()
+    if body is None:
+        return await loop.run_in_executor(None, Catalog.build, version)
+    if snapshot_version != version:
+        snapshot = await loop.run_in_executor(None, Catalog.rebuild, version)
+        if snapshot is not None:
+            return snapshot
+    if etag is not None and etag == snapshot_etag:
+        return snapshot_etag, None
+    return snapshot_etag, body
+
+
+async def token_owner(db, token):
+    """Method used to get the username of the owner of a valid token.
+
+    Raises:
+        NappsEntryDoesNotExists: If the token is invalid or expired.
+    """
+    metrics.count('Token.owner')
+    pipe = db.pipeline(transaction=False)
+    pipe.hmget("token:%s" % token, 'user', 'created_at', 'expiration_time')
+    pipe.ttl("token:%s" % token)
+    (username, created_at, expiration_time), ttl = await pipe.execute()
+    if not username or (ttl == -1 and not Token.is_legacy_valid(
+            created_at, expiration_time)):
+        raise NappsEntryDoesNotExists("Token not found.")
+    return username
+
+
+async def create_token(db, user, expiration_time=86400):
+    """Method used to create a token for a user in a single round trip.
+
+    See :meth:`napps_server.core.models.User.create_token`.
+
+    Returns:
+        token (:class:`napps_server.core.models.Token`): The new token.
+    """
+    token = Token(user=user, expiration_time=expiration_time)
+    ttl = int((token.expires_at - datetime.utcnow()).total_seconds())
+    tokens_key = "%s:tokens" % user.redis_key
+    pipe = db.pipeline(transaction=False)
+    pipe.hset(token.redis_key, mapping=token.redis_fields())
+    pipe.expire(token.redis_key, ttl)
+    pipe.lpush(tokens_key, token.redis_key)
+    pipe.ltrim(tokens_key, 0, 9)
+    await pipe.execute()
+    return token
@@ -3,11 +3,13 @@
 # System imports
 
 # Third-party imports
-from flask import Blueprint, Response, jsonify, request
+from flask import Blueprint, Response, request
 
 # Local source tree imports
-from napps_server.core.decorators import requires_auth, requires_token
+from napps_server.core.decorators import (check_request_auth, requires_auth,
+                                          requires_token)
 from napps_server.core.models import User
+from napps_server.core.serialization import json_response
 from napps_server.core.utils import authenticate
 
 # Flask Blueprints
@@ -22,11 +24,11 @@ def napps_auth():
     :return: A token to the user
     """
     auth = request.authorization
-    user = User.get(auth.username)
-    if not auth or not User.check_auth(auth.username, auth.password):
+    if not check_request_auth():
         return authenticate()
+    user = User.get(auth.username)
     token = user.create_token()
-    return jsonify(token.as_dict()), 201
+    return json_response(token.as_dict(), 201)
 
 
 @api.route("/auth/verify/", methods=["POST"])
@@ -0,0 +1,49 @@
+"""Module used to autocomplete napps and user names."""
+# System imports
+
+# Third-party imports
+from flask import Blueprint, request
+
+# Local source tree imports
+from napps_server import config
+from napps_server.core import search
+from napps_server.core.serialization import json_response
+
+# Flask Blueprints
+api = Blueprint('autocomplete_api', __name__)
+
+KINDS = ('napps', 'users')
+
+
+@api.route('/autocomplete', methods=['GET'])
+@api.route('/autocomplete/', methods=['GET'])
+def autocomplete():
+    """Method used to autocomplete napps and user names.
+
+    This method creates the '/autocomplete/' endpoint, which receives the
+    text typed so far in the 'prefix' parameter. Napps are completed by
+    '<username>/<name>' or by their name alone, and users by their username.
+    The optional 'kind' parameter ('napps' or 'users') restricts the
+    completion to one of them and 'limit' sets the maximum number of matches.
+
+    Returns:
+        json (string): JSON with the matches of each kind.
+        HTTP code 400 if kind or limit are invalid.
+    """
+    prefix = request.args.get('prefix', '')
+    kind = request.args.get('kind')
+    if kind is not None and kind not in KINDS:
+        return json_response({'error': 'kind must be napps or users'}, 400)
+
+    try:
+        limit = int(request.args.get('limit', config.AUTOCOMPLETE_LIMIT))
+        if limit <= 0:
+            raise ValueError
+    except ValueError:
+        return json_response({'error': 'limit must be a positive integer'},
+                             400)
+
+    limit = min(limit, config.MAX_PAGE_SIZE)
+    kinds = [kind] if kind else KINDS
+    return json_response({kind: search.complete(kind, prefix, limit)
+                          for kind in kinds}, 200)
@@ -3,10 +3,11 @@
 import time
 
 # Third-party imports
-from flask import Blueprint, jsonify
+from flask import Blueprint
 
 # Local source tree imports
 from napps_server import config
+from napps_server.core.serialization import json_response
 
 db_con = config.DB_CON
 
@@ -115,7 +116,7 @@ def get_all_comments(key):
 
         comment_number += 1
 
-    return jsonify({'comments': comments_dict})
+    return json_response({'comments': comments_dict})
 
 
 def format_comment(date):
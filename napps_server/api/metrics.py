@@ -0,0 +1,33 @@
+"""Module used to expose the metrics of the server."""
+# System imports
+
+# Third-party imports
+from flask import Blueprint, Response
+from redis.exceptions import RedisError
+
+# Local source tree imports
+from napps_server.core import metrics
+
+# Flask Blueprints
+api = Blueprint('metrics_api', __name__)
+
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Method used to expose the metrics of every worker process.
+
+    This method creates the '/metrics' endpoint, scraped by Prometheus. It
+    answers with the latency histograms, the responses and the bytes sent by
+    route and the operations of the model layer, summed over every worker,
+    and with the requests in flight, the user cache and the redis pools of
+    each live worker.
+
+    Returns:
+        text (string): Metrics in the Prometheus text format.
+        HTTP code 503 if redis is unreachable.
+    """
+    try:
+        text = metrics.registry.render()
+    except RedisError as error:
+        return Response(str(error), 503, content_type='text/plain')
+    return Response(text, content_type=metrics.CONTENT_TYPE)
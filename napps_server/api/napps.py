@@ -1,24 +1,25 @@
 """Module used to make avaliable napps routes."""
 # System imports
 import os
-import re
-from time import strftime
 
 # Third-party imports
 
 # Local source tree imports
-from flask import Blueprint, Response, jsonify, request
+from flask import Blueprint, Response, request, send_file
+from werkzeug.exceptions import RequestEntityTooLarge
 
+from napps_server import config
+from napps_server.core import archive, search, storage, uploads
 from napps_server.core.decorators import requires_token, validate_json
 from napps_server.core.exceptions import (InvalidUser, InvalidNappMetaData,
                                           NappsEntryDoesNotExists)
-from napps_server.core.models import Napp, User
-from napps_server.core.utils import get_request_data
+from napps_server.core.models import Catalog, Napp, User
+from napps_server.core.serialization import json_response, raw_response
+from napps_server.core.utils import get_pagination, get_request_data
 
 # Flask Blueprints
 api = Blueprint('napp_api', __name__)
 
-NAPP_REPO = '/var/www/kytos/napps/repo'
 ALLOWED_EXTENSIONS = set(['napp'])
 
 
@@ -28,22 +29,18 @@ def _allowed_file(filename):
         filename.rsplit('.', 1)[1] in ALLOWED_EXTENSIONS
 
 
-def _curr_date():
-    """Return current date on the format YYYMMDDD."""
-    return strftime("%Y%m%d")
-
-
-def _napp_versioned_name(username, napp_name):
-    """Build the napp filename with a timestamp and a counter."""
-    user_repo = os.path.join(NAPP_REPO, username)
-    basename = napp_name + '-' + _curr_date() + '-'
-    regexp = re.compile(r'' + basename + '(\d+)' + '.napp')
-    counter = 0
-    for file in os.listdir(user_repo):
-        matched = regexp.match(file)
-        if matched and int(matched.group(1)) > counter:
-            counter = int(matched.group(1))
-    return basename + str(counter + 1) + '.napp'
+def _catalog_response():
+    """Serve the stored catalog snapshot, answering 304 if it is unchanged."""
+    etags = request.if_none_match
+    known_etag = next(iter(etags), None) if len(etags) == 1 else None
+    etag, body = Catalog.get(known_etag)
+    if body is None or etags.contains(etag):
+        response = Response(status=304)
+    else:
+        # The snapshot is already encoded, it is sent as it is.
+        response = raw_response(body)
+    response.set_etag(etag)
+    return response
 
 
 @api.route('/napps/', methods=['GET'])
@@ -51,17 +48,56 @@ def get_napps():
     """Method used to shows all network applications.
 
     This method creates the '/napps/' endpoint to show all network applications
-    as a json format.
+    as a json format. If a 'limit' (or 'length') or a 'cursor' is given, only
+    that page is returned, ordered by '<username>/<name>', together with the
+    'next_cursor' to be sent to get the following page.
+
+    Otherwise the stored catalog snapshot is served with a strong ETag, and
+    requests with a matching If-None-Match are answered with HTTP code 304.
 
     Returns:
         json (string): Strnig with all information in JSON format.
     """
-    napps = [napp.as_dict() for napp in Napp.all()]
-    params = request.args
-    length = params.get('length')
-    if length and int(length) > 0:
-        napps = napps[0:int(length)]
-    return jsonify({'napps': napps}), 200
+    try:
+        cursor, limit = get_pagination(request.args)
+    except ValueError:
+        return json_response({'error': 'limit must be a positive integer'},
+                             400)
+
+    if limit is None:
+        return _catalog_response()
+
+    page, next_cursor = Napp.page(cursor, limit)
+    napps = [napp.as_dict() for napp in page]
+    return json_response({'napps': napps, 'next_cursor': next_cursor}, 200)
+
+
+@api.route('/napps/search', methods=['GET'])
+@api.route('/napps/search/', methods=['GET'])
+def search_napps():
+    """Method used to search network applications.
+
+    This method creates the '/napps/search/' endpoint, which receives the
+    terms to be searched in the 'q' parameter and an optional 'limit'. Only
+    napps matching every term (in their name, description, long_description
+    or tags) are returned, most relevant first.
+
+    Returns:
+        json (string): String with the napps found in JSON format.
+        HTTP code 400 if limit is not a positive integer.
+    """
+    try:
+        limit = int(request.args.get('limit', config.SEARCH_LIMIT))
+        if limit <= 0:
+            raise ValueError
+    except ValueError:
+        return json_response({'error': 'limit must be a positive integer'},
+                             400)
+
+    keys = search.search(request.args.get('q', ''),
+                         min(limit, config.MAX_PAGE_SIZE))
+    napps = [napp.as_dict() for napp in Napp.get_many(keys)]
+    return json_response({'napps': napps}, 200)
 
 
 @api.route('/napps/<username>/', methods=['GET'])
@@ -84,23 +120,98 @@ def get_napp(username, name=''):
     try:
         user = User.get(username)
     except NappsEntryDoesNotExists:
-        return jsonify({
+        return json_response({
             'error': 'Username {} not found'.format(username)
-        }), 404
+        }, 404)
 
     if not name:
         napps = [napp.as_dict() for napp in user.get_all_napps()]
-        return jsonify(napps), 200
+        return json_response(napps, 200)
 
     try:
         napp = user.get_napp_by_name(name)
     except NappsEntryDoesNotExists:
-        return jsonify({
+        return json_response({
             'error': 'NApp {} not found for the username {}'.format(name,
                                                                     username)
-        }), 404
+        }, 404)
+
+    return json_response(napp.as_dict(), 200)
+
+
+@api.route('/napps/<username>/<name>/versions/', methods=['GET'])
+def get_napp_versions(username, name):
+    """Method used to list the versions of a napp.
+
+    This method creates the '/napps/<username>/<name>/versions/' endpoint,
+    which lists the uploaded versions of a napp, latest first, with their
+    filename, sequence, digest (SHA-256), size and upload time. Only redis is
+    read, the filesystem is not touched.
+
+    Parameters:
+        username (string): Name of a user.
+        name (string): Napp name.
+
+    Returns:
+        json (string): String with the versions in JSON format.
+        HTTP code 404 if no version was found for the NApp.
+    """
+    versions = storage.list_versions(username, name)
+    if not versions:
+        return json_response({
+            'error': 'No versions found for the NApp {}/{}'.format(username,
+                                                                  name)
+        }, 404)
+    return json_response({'versions': versions}, 200)
+
+
+@api.route('/napps/<username>/<name>/download/', methods=['GET'])
+@api.route('/napps/<username>/<name>/download/<version>', methods=['GET'])
+def download_napp(username, name, version=None):
+    """Method used to download a .napp file.
+
+    This method creates the '/napps/<username>/<name>/download/[<version>]'
+    endpoint. The version may be its filename or its sequence number; the
+    latest version is sent if it is not given. The file digest is used as a
+    strong ETag, so conditional and Range requests are supported, and the file
+    is sent with sendfile when the WSGI server allows it. If
+    DOWNLOAD_ACCEL_REDIRECT is set, the transfer is handed to the front proxy
+    with an X-Accel-Redirect header instead.
 
-    return jsonify(napp.as_dict()), 200
+    Parameters:
+        username (string): Name of a user.
+        name (string): Napp name.
+        version (string): Filename or sequence number of a version.
+
+    Returns:
+        file (bytes): The .napp file.
+        HTTP code 304 if the client already has the file.
+        HTTP code 404 if the version was not found for the NApp.
+    """
+    found = storage.resolve(username, name, version)
+    if found is None:
+        return json_response({
+            'error': 'Version not found for the NApp {}/{}'.format(username,
+                                                                  name)
+        }, 404)
+
+    # A given version never changes, the latest one must be revalidated.
+    max_age = config.DOWNLOAD_MAX_AGE if version else 0
+
+    if config.DOWNLOAD_ACCEL_REDIRECT:
+        blob = os.path.relpath(found['path'], storage.blobs_dir())
+        response = Response(mimetype='application/octet-stream')
+        response.headers['X-Accel-Redirect'] = \
+            config.DOWNLOAD_ACCEL_REDIRECT + blob
+        response.headers['Content-Disposition'] = \
+            'attachment; filename="{}"'.format(found['filename'])
+        response.set_etag(found['digest'])
+        response.cache_control.max_age = max_age
+        return response.make_conditional(request)
+
+    return send_file(found['path'], mimetype='application/octet-stream',
+                     as_attachment=True, download_name=found['filename'],
+                     conditional=True, etag=found['digest'], max_age=max_age)
 
 
 @api.route("/napps/", methods=["POST"])
@@ -110,13 +221,19 @@ def register_napp(user):
     """Method to register a new Network Application.
 
     This method creates the '/napps' endpoint to register a new Network
-    Application.
+    Application. The .napp file is streamed to the repository filesystem,
+    with its SHA-256 computed on the fly, and stored once per distinct content.
+    The NApp metadata and README are read from the kytos.json and README.rst
+    inside the .napp file. Form fields are optional, but username, name and
+    version must match the archive if sent.
 
     Returns:
         HTTP code 201 if napp were succesfully created.
         HTTP code 400 if there were not .napp file sent on the request.
-        HTTP code 400 if there were errors on the NApp metadata.
+        HTTP code 400 if there were errors on the NApp metadata or if it does
+            not match the form fields.
         HTTP code 401 if the current user is trying to upload someone else NApp
+        HTTP code 413 if the .napp file is bigger than MAX_NAPP_SIZE.
     """
     #: As we expect here a multipart/form POST, then the 'data' may come on the
     #: form attribute of the request, instead of the json attribute.
@@ -125,34 +242,35 @@ def register_napp(user):
     # Get the name of the uploaded file
     sent_file = request.files.get('file')
 
-    username = content.get('username')
-    napp_name = content.get('name')
-
     if not sent_file or not _allowed_file(sent_file.filename):
         return Response("Invalid file/file extension.", 400)
 
     try:
-        Napp.new_napp_from_dict(content, user)
-    except InvalidUser:
-        return Response("Permission denied.", 401)
-    except InvalidNappMetaData:
-        return Response("Invalid metadata.", 400)
+        incoming = uploads.ingest(sent_file, config.MAX_NAPP_SIZE)
+    except RequestEntityTooLarge:
+        return Response("File too large.", 413)
 
-    user_repo = os.path.join(NAPP_REPO, username)
-    os.makedirs(user_repo, exist_ok=True)
-    napp_latest = napp_name + '-latest.napp'
-    napp_filename = _napp_versioned_name(username, napp_name)
-    # Move the file form the temporal folder to
-    # the upload folder we setup
-    sent_file.save(os.path.join(user_repo, napp_filename))
+    try:
+        metadata = archive.read_metadata(incoming)
+        archive.check_fields(metadata, content)
+    except InvalidNappMetaData as error:
+        incoming.discard()
+        return Response(str(error), 400)
+
+    # The archive is the source of truth of the NApp metadata.
+    content.update(metadata)
 
-    # Updating the 'latest' version, symbolic linking it to the uploaded file.
+    # The file is stored as a content-addressed blob, referenced by the new
+    # version, which also becomes the 'latest' one, before the NApp is saved.
     try:
-        os.remove(os.path.join(user_repo, napp_latest))
-    except FileNotFoundError:
-        pass
-    os.symlink(os.path.join(user_repo, napp_filename),
-               os.path.join(user_repo, napp_latest))
+        Napp.new_napp_from_dict(content, user, incoming)
+    except (InvalidUser, NappsEntryDoesNotExists):
+        # The NApp belongs to someone else, whether registered or not.
+        incoming.discard()
+        return Response("Permission denied.", 401)
+    except InvalidNappMetaData:
+        incoming.discard()
+        return Response("Invalid metadata.", 400)
 
     return Response("Napp succesfully created", 201)
 
@@ -175,20 +293,20 @@ def delete_napp(user, username, name):
         HTTP code 404 if the NApp was not found for the given username.
     """
     if user.username != username:
-        return jsonify({"Your user can't delete this NApp" }), 401
+        return json_response({"Your user can't delete this NApp" }, 401)
 
     try:
         napp = user.get_napp_by_name(name)
     except NappsEntryDoesNotExists:
         msg = 'NApp {} not found for the user {}'.format(name, username)
-        return jsonify({'error': msg}), 404
+        return json_response({'error': msg}, 404)
 
     try:
         napp.delete()
     except NappsEntryDoesNotExists:
         msg = 'Something went wrong while trying to delete the NApp {}/{}.'
         msg += msg.format(username, name)
-        return jsonify({'error': msg}), 404
+        return json_response({'error': msg}, 404)
 
     msg = 'Napp {} was deleted.'
-    return jsonify({'success': msg}), 200
+    return json_response({'success': msg}, 200)
@@ -0,0 +1,39 @@
+"""Module used to report the status of the server."""
+# System imports
+import time
+
+# Third-party imports
+from flask import Blueprint
+from redis.exceptions import RedisError
+
+# Local source tree imports
+from napps_server import config
+from napps_server.core.serialization import json_response
+
+# Flask Blueprints
+api = Blueprint('status_api', __name__)
+
+
+@api.route('/status/', methods=['GET'])
+def get_status():
+    """Method used to report the status of the redis connection.
+
+    This method creates the '/status/' endpoint, which answers with the round
+    trip time of a redis PING and with the usage of the connection pool of
+    the process that handled the request.
+
+    Returns:
+        json (string): Redis status and pool usage in JSON format.
+        HTTP code 503 if redis is unreachable.
+    """
+    status = {}
+    start = time.perf_counter()
+    try:
+        config.DB_CON.ping()
+        status['ping_ms'] = (time.perf_counter() - start) * 1000
+        code = 200
+    except RedisError as error:
+        status['error'] = str(error)
+        code = 503
+    status['pool'] = config.DB_CON.pool_stats()
+    return json_response({'redis': status}, code)
@@ -4,13 +4,14 @@
 # Third-party imports
 
 # Local source tree imports
-from flask import Blueprint, jsonify, redirect, request, Response
+from flask import Blueprint, redirect, request, Response
 
 from napps_server.core.decorators import (requires_token, validate_json,
                                           validate_schema)
 from napps_server.core.exceptions import NappsEntryDoesNotExists
 from napps_server.core.models import User
-from napps_server.core.utils import get_request_data
+from napps_server.core.serialization import json_response
+from napps_server.core.utils import get_pagination, get_request_data
 
 # Flask Blueprints
 api = Blueprint('user_api', __name__)
@@ -57,13 +58,26 @@ def get_users():
     """Method used to show all applications developers.
 
     This method will creates '/users/' endpoint that shows all application
-    author usernames with their informations.
+    author usernames with their informations. If a 'limit' or a 'cursor' is
+    given, only that page is returned, ordered by username, together with the
+    'next_cursor' to be sent to get the following page.
 
     Returns:
         json (string): JSON with detailed users.
     """
-    users = {user.username: user.as_dict() for user in User.all()}
-    return jsonify({'users': users}), 200
+    try:
+        cursor, limit = get_pagination(request.args)
+    except ValueError:
+        return json_response({'error': 'limit must be a positive integer'},
+                             400)
+
+    if limit is None:
+        users = {user.username: user.as_dict() for user in User.all()}
+        return json_response({'users': users}, 200)
+
+    page, next_cursor = User.page(cursor, limit)
+    users = {user.username: user.as_dict() for user in page}
+    return json_response({'users': users, 'next_cursor': next_cursor}, 200)
 
 
 @api.route('/users/<username>/', methods=['GET'])
@@ -84,9 +98,9 @@ def get_user(username):
     try:
         user = User.get(username)
     except NappsEntryDoesNotExists:
-        return jsonify({'error': 'User not found'}), 404
+        return json_response({'error': 'User not found'}, 404)
 
-    return jsonify(user.as_dict()), 200
+    return json_response(user.as_dict(), 200)
 
 
 @api.route("/users/<username>/confirm/<token>/", methods=["GET"])
@@ -142,12 +156,12 @@ def delete_user(user, username):
 
     if not user.username == username:
         msg = 'You cannot delete other users.'
-        return jsonify({'error': msg}), 403
+        return json_response({'error': msg}, 403)
 
     try:
         user.delete()
         msg = 'The user {} was deleted.'.format(username)
-        return jsonify({'success': msg}), 200
+        return json_response({'success': msg}, 200)
     except:
         msg = 'Ops! Something went wrong while trying to delete the user {}'
-        return jsonify({'error': msg.format(username)}), 500
+        return json_response({'error': msg.format(username)}, 500)
@@ -0,0 +1,60 @@
+"""Module with the factory of the napps-server Flask application."""
+# Third-party imports
+from flask import Flask
+
+# Local source tree imports
+from napps_server import config
+from napps_server.api import (auth, autocomplete, metrics, napps, status,
+                              users)
+from napps_server.core import connection
+from napps_server.core.metrics import instrument
+from napps_server.core.uploads import UploadRequest
+from napps_server.core.utils import templates
+
+
+def create_app():
+    """Method used to create the napps-server Flask application.
+
+    Returns:
+        app (:class:`flask.Flask`): The application, with every blueprint
+            registered and the email templates compiled.
+    """
+    app = Flask('napps_server')
+
+    # Record the latency, status and size of the responses of each route
+    if config.METRICS_ENABLED:
+        instrument(app)
+
+    # Send the reads of each request to the replicas until it writes
+    app.before_request(connection.start_request)
+
+    # Stream uploads to the repository filesystem, rejecting big requests
+    # early
+    app.request_class = UploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = config.MAX_CONTENT_LENGTH
+
+    # Let the front web server send the .napp files, if configured
+    app.config['USE_X_SENDFILE'] = config.DOWNLOAD_X_SENDFILE
+
+    # Expose login and logout endpoints
+    app.register_blueprint(auth.api)
+
+    # Expose user endpoints
+    app.register_blueprint(users.api)
+
+    # Expose application endpoints
+    app.register_blueprint(napps.api)
+
+    # Expose autocomplete endpoints
+    app.register_blueprint(autocomplete.api)
+
+    # Expose the status of the redis connection
+    app.register_blueprint(status.api)
+
+    # Expose the metrics in the Prometheus text format
+    if config.METRICS_ENABLED:
+        app.register_blueprint(metrics.api)
+
+    # Compile the email templates before serving requests
+    templates.preload()
+    return app
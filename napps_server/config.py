@@ -1,17 +1,209 @@
-"""Module with default settings to napps-server."""
+"""Module with default settings to napps-server.
+
+Any setting may be overridden by a Python file whose path is given in the
+NAPPS_SERVER_CONFIG environment variable, and then by an environment variable
+named after the setting with the NAPPS_ prefix (e.g. NAPPS_REDIS_UNIX_SOCKET).
+Environment values are converted to the type of the default value, and
+comma separated values to tuples of numbers.
+"""
 import os
-import redis
+
+from napps_server.core.connection import RedisConnection, RedisRouter
 
 # Define the application directory
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
-# Define the Database Connection - We are working with REDIs
+# Define the Database Connection - We are working with REDIs. If
+# REDIS_UNIX_SOCKET is set, HOST and PORT are ignored.
 HOST = '127.0.0.1'
-PORT = '6379'
-DB = '0'
+PORT = 6379
+DB = 0
+REDIS_PASSWORD = None
+REDIS_UNIX_SOCKET = None
 
-DB_CON = redis.StrictRedis(host=HOST, port=PORT, db=DB, charset="utf-8",
-                           decode_responses=True)
+# Define the redis connection pool of each process: maximum connections and
+# how long to wait for a free one, socket timeouts (in seconds), TCP keepalive
+# and how many idle seconds before a connection is checked with a PING.
+REDIS_MAX_CONNECTIONS = 50
+REDIS_POOL_TIMEOUT = 5
+REDIS_SOCKET_TIMEOUT = 5
+REDIS_SOCKET_CONNECT_TIMEOUT = 2
+REDIS_SOCKET_KEEPALIVE = True
+REDIS_HEALTH_CHECK_INTERVAL = 30
+
+# Define the read replicas, as comma separated 'host:port' or unix socket
+# paths. Reads are sent to them, unless the request already wrote or they are
+# more than REDIS_REPLICA_MAX_LAG bytes of the replication stream behind the
+# primary, which is checked every REDIS_REPLICA_CHECK_INTERVAL seconds. Values
+# cached in the processes (users, catalog) are always read from the primary.
+REDIS_REPLICAS = ''
+REDIS_REPLICA_MAX_LAG = 1024 * 1024
+REDIS_REPLICA_CHECK_INTERVAL = 1
 
 # Define NAPPS_SERVER CONFIGURATION
 NAPPS_API_URL = 'https://napps.kytos.io/api'
+
+# Define where .napp files are stored and how they are uploaded: max size of
+# a .napp file and of a whole request, in bytes, size of the chunks read and
+# size up to which uploads are kept in memory, so uploading a .napp file
+# already stored writes nothing to disk.
+NAPP_REPO = '/var/www/kytos/napps/repo'
+MAX_NAPP_SIZE = 50 * 1024 * 1024
+MAX_CONTENT_LENGTH = MAX_NAPP_SIZE + 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_SPOOL_SIZE = 1024 * 1024
+
+# Define how .napp files are downloaded. Set DOWNLOAD_ACCEL_REDIRECT to the
+# internal location of NAPP_REPO/.blobs/ on nginx (e.g. '/_blobs/') to hand
+# transfers over with X-Accel-Redirect, or DOWNLOAD_X_SENDFILE to use the
+# X-Sendfile header (apache, lighttpd). Versioned downloads are cached by
+# clients for DOWNLOAD_MAX_AGE seconds.
+DOWNLOAD_ACCEL_REDIRECT = None
+DOWNLOAD_X_SENDFILE = False
+DOWNLOAD_MAX_AGE = 365 * 24 * 60 * 60
+
+# Define the pagination of listing endpoints (GET /napps/ and GET /users/)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Define the in-process cache of users: max number of entries and their
+# lifetime in seconds. Changes are also propagated through redis pub/sub.
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 30
+
+# Define how bcrypt verifications are run: number of worker threads per
+# process and how long a request waits for one, in seconds. Requests that time
+# out are answered with a 503, asking to retry after BCRYPT_RETRY_AFTER
+# seconds.
+BCRYPT_WORKERS = 4
+BCRYPT_TIMEOUT = 10
+BCRYPT_RETRY_AFTER = 1
+
+# Define the memory-only cache of verified credentials: max number of entries
+# and their lifetime in seconds.
+AUTH_CACHE_SIZE = 1024
+AUTH_CACHE_TTL = 60
+
+# Define the SMTP server used by the mail worker (napps-mailer) and how it
+# retries: attempts per email and first retry delay in seconds, doubled at
+# each attempt.
+SMTP_HOST = 'localhost'
+SMTP_PORT = 25
+SMTP_TIMEOUT = 30
+MAIL_FROM = 'no-reply@kytos.io'
+MAILER_BATCH_SIZE = 50
+MAILER_MAX_ATTEMPTS = 5
+MAILER_BACKOFF = 30
+
+# Define how email templates are compiled: in development mode, set
+# TEMPLATES_AUTO_RELOAD to recompile templates whose file changed. Set
+# TEMPLATES_CACHE_DIR to keep the compiled templates on disk between runs.
+TEMPLATES_AUTO_RELOAD = False
+TEMPLATES_CACHE_DIR = None
+
+# Define how napps-server is served: address, worker processes (0 means twice
+# the number of CPUs plus one), 'processes' or 'threads' workers and threads
+# per process, and whether the asyncio application is served instead. Workers
+# are recycled after SERVER_MAX_REQUESTS requests (plus a random jitter),
+# restarted if silent for SERVER_TIMEOUT seconds and given
+# SERVER_GRACEFUL_TIMEOUT seconds to finish their requests when stopped.
+SERVER_BIND = '127.0.0.1:8000'
+SERVER_WORKERS = 0
+SERVER_WORKER_TYPE = 'processes'
+SERVER_THREADS = 4
+SERVER_ASGI = False
+SERVER_MAX_REQUESTS = 10000
+SERVER_MAX_REQUESTS_JITTER = 1000
+SERVER_TIMEOUT = 30
+SERVER_GRACEFUL_TIMEOUT = 30
+SERVER_KEEPALIVE = 5
+
+# Define the JSON encoder of the responses: 'orjson', 'ujson' or 'json'. If
+# None, the fastest one installed is used.
+JSON_ENCODER = None
+
+# Define how long a process may take to build the catalog snapshot, in seconds.
+# Only one process builds it at a time, the others serve the previous one.
+CATALOG_BUILD_TIMEOUT = 30
+
+# Define the default number of results of GET /napps/search/
+SEARCH_LIMIT = 20
+
+# Define the default number of results of GET /autocomplete/
+AUTOCOMPLETE_LIMIT = 10
+
+# Define the metrics served on GET /metrics, in the Prometheus text format:
+# whether requests are recorded and the endpoint exposed, the upper bounds
+# (in seconds) of the buckets of the request durations and the seconds between
+# flushes of the metrics of each worker process to redis.
+METRICS_ENABLED = True
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                           5, 10)
+METRICS_FLUSH_INTERVAL = 5
+
+
+def _parse(value, default):
+    """Convert an environment value to the type of the default value."""
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, (int, float)):
+        return type(default)(value)
+    if isinstance(default, tuple):
+        return tuple(float(item) for item in value.split(','))
+    if default is None and value.lower() in ('', 'none'):
+        return None
+    return value
+
+
+def _load_settings(settings):
+    """Override the settings with the config file and the environment."""
+    path = os.environ.get('NAPPS_SERVER_CONFIG')
+    if path:
+        overrides = {}
+        with open(path) as config_file:
+            exec(compile(config_file.read(), path, 'exec'), overrides)
+        settings.update((name, value) for name, value in overrides.items()
+                        if name.isupper())
+    for name, default in list(settings.items()):
+        value = os.environ.get('NAPPS_' + name)
+        if name.isupper() and value is not None:
+            settings[name] = _parse(value, default)
+
+
+_load_settings(globals())
+
+
+def _redis_connection(address=None):
+    """Create a redis connection with the configured pool settings.
+
+    The address of a replica is either 'host:port' or a unix socket path.
+    Without address, the connection is to the primary.
+    """
+    host, port, socket = HOST, PORT, REDIS_UNIX_SOCKET
+    if address and address.startswith('/'):
+        socket = address
+    elif address:
+        host, _, port = address.rpartition(':')
+        socket = None
+    return RedisConnection(host=host, port=port, db=DB,
+                           password=REDIS_PASSWORD, unix_socket_path=socket,
+                           max_connections=REDIS_MAX_CONNECTIONS,
+                           pool_timeout=REDIS_POOL_TIMEOUT,
+                           socket_timeout=REDIS_SOCKET_TIMEOUT,
+                           socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT,
+                           socket_keepalive=REDIS_SOCKET_KEEPALIVE,
+                           health_check_interval=REDIS_HEALTH_CHECK_INTERVAL)
+
+
+if REDIS_REPLICAS:
+    if isinstance(REDIS_REPLICAS, str):
+        REDIS_REPLICAS = [address.strip()
+                          for address in REDIS_REPLICAS.split(',')
+                          if address.strip()]
+    DB_CON = RedisRouter(_redis_connection(),
+                         [_redis_connection(address)
+                          for address in REDIS_REPLICAS],
+                         max_lag=REDIS_REPLICA_MAX_LAG,
+                         check_interval=REDIS_REPLICA_CHECK_INTERVAL)
+else:
+    DB_CON = _redis_connection()
@@ -0,0 +1,123 @@
+"""Module used to read the metadata of .napp archives.
+
+A .napp file is a xz compressed tarball holding the napp source code, its
+metadata (``kytos.json``) and its ``README.rst``. The archive is read as a
+stream: members are decompressed in order and reading stops as soon as both
+files are found, so the archive is never extracted to disk.
+"""
+import json
+import os
+import tarfile
+
+from napps_server.core.exceptions import InvalidNappMetaData
+
+#: Biggest kytos.json or README.rst accepted, in bytes.
+MAX_MEMBER_SIZE = 1024 * 1024
+
+METADATA_FILE = 'kytos.json'
+README_FILE = 'README.rst'
+
+
+def _is_wanted(member, filename):
+    """Check if a member is the file of the napp root with the given name.
+
+    The root may be the archive root or its single top directory.
+    """
+    parts = [part for part in member.name.split('/') if part not in ('', '.')]
+    return member.isfile() and parts[-1:] == [filename] and len(parts) <= 2
+
+
+def read_metadata(fileobj):
+    """Method used to read the metadata and README of a .napp archive.
+
+    Parameters:
+        fileobj (file): Binary file object with the archive. It is read from
+                        the beginning.
+
+    Returns:
+        metadata (dict): Contents of kytos.json, with the README.rst contents
+                         in the 'readme' key, if it exists.
+
+    Raises:
+        InvalidNappMetaData: If the archive is invalid or has no kytos.json.
+    """
+    metadata = None
+    readme = None
+    fileobj.seek(0)
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|xz') as napp:
+            for member in napp:
+                if metadata is None and _is_wanted(member, METADATA_FILE):
+                    metadata = _read_member(napp, member)
+                elif readme is None and _is_wanted(member, README_FILE):
+                    readme = _read_member(napp, member)
+                if metadata is not None and readme is not None:
+                    break
+    except (tarfile.TarError, EOFError, OSError) as error:
+        raise InvalidNappMetaData('Invalid .napp file: {}'.format(error))
+    finally:
+        fileobj.seek(0)
+
+    if metadata is None:
+        raise InvalidNappMetaData('Missing {}'.format(METADATA_FILE))
+    try:
+        metadata = json.loads(metadata)
+    except ValueError:
+        raise InvalidNappMetaData('Invalid {}'.format(METADATA_FILE))
+    if not isinstance(metadata, dict):
+        raise InvalidNappMetaData('Invalid {}'.format(METADATA_FILE))
+
+    # WARNING: This will be removed in future versions, when 'author' will
+    # be removed.
+    metadata['username'] = metadata.get('username', metadata.get('author'))
+    if readme is not None:
+        metadata['readme'] = readme
+    return metadata
+
+
+def read_metadata_from_path(path):
+    """Method used to read the metadata and README of a .napp file.
+
+    Parameters:
+        path (string): Path of the .napp file.
+
+    Returns:
+        metadata (dict): Same as :func:`read_metadata`.
+    """
+    with open(path, 'rb') as fileobj:
+        return read_metadata(fileobj)
+
+
+def _read_member(napp, member):
+    """Read a text member of the archive, refusing big ones."""
+    if member.size > MAX_MEMBER_SIZE:
+        raise InvalidNappMetaData('{} is too big'.format(
+            os.path.basename(member.name)))
+    try:
+        return napp.extractfile(member).read().decode('utf-8')
+    except UnicodeDecodeError:
+        raise InvalidNappMetaData('{} is not UTF-8 encoded'.format(
+            os.path.basename(member.name)))
+
+
+def check_fields(metadata, fields, keys=('username', 'name', 'version')):
+    """Method used to compare the metadata of an archive with form fields.
+
+    Parameters:
+        metadata (dict): Metadata read from the archive.
+        fields (dict): Fields sent with the upload.
+        keys (iterable): Keys required in the metadata and compared. Keys
+                         missing from the fields are not compared.
+
+    Raises:
+        InvalidNappMetaData: If any of the keys is missing from the metadata
+                             (e.g. neither username nor author is set) or
+                             differs.
+    """
+    for key in keys:
+        if not metadata.get(key):
+            msg = "Missing key {} in the .napp {}."
+            raise InvalidNappMetaData(msg.format(key, METADATA_FILE))
+        if fields.get(key) and str(fields[key]) != str(metadata.get(key)):
+            msg = "Field {} does not match the .napp {}."
+            raise InvalidNappMetaData(msg.format(key, METADATA_FILE))
@@ -0,0 +1,153 @@
+"""Module with the in-process caches used by napps-server."""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from napps_server import config
+
+db_con = config.DB_CON
+
+
+class TTLCache(object):
+    """Bounded, thread-safe LRU cache whose entries expire after a TTL."""
+
+    def __init__(self, maxsize, ttl, timer=time.monotonic):
+        """Constructor of TTLCache class.
+
+        Parameters:
+            maxsize (int): Maximum number of entries. The least recently used
+                           entry is evicted when it is exceeded.
+            ttl (float): Lifetime of each entry, in seconds.
+            timer (callable): Clock used to expire entries.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Method used to get a cached value.
+
+        Parameters:
+            key (string): Key of the entry.
+
+        Returns:
+            value: The cached value, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.timer():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, generation=None):
+        """Method used to store a value.
+
+        Parameters:
+            key (string): Key of the entry.
+            value: Value to be cached.
+            generation (int): Value of :attr:`generation` read before the
+                value was loaded. If any invalidation happened since then, the
+                value may be stale and it is not stored.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (self.timer() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Method used to remove an entry from the cache.
+
+        Parameters:
+            key (string): Key of the entry.
+        """
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Method used to remove all entries from the cache."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    @property
+    def stats(self):
+        """Method used to return the cache counters.
+
+        Returns:
+            stats (dict): Hits, misses, current size and limits of the cache.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._entries), 'maxsize': self.maxsize,
+                'ttl': self.ttl}
+
+
+class PubSubInvalidator(object):
+    """Carry the invalidations of a cache to every worker process.
+
+    Invalidations are published on a redis channel and every process holding
+    a copy of the cache listens to it in a background thread. The listener is
+    started lazily, once per process, so it is safe to use after a fork.
+    """
+
+    def __init__(self, channel, cache):
+        """Constructor of PubSubInvalidator class.
+
+        Parameters:
+            channel (string): Redis pub/sub channel.
+            cache (:class:`TTLCache`): Cache to be kept coherent.
+        """
+        self.channel = channel
+        self.cache = cache
+        self._pid = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _handle(self, message):
+        """Invalidate the key received from another process."""
+        self.cache.invalidate(message['data'])
+
+    def listen(self):
+        """Method used to start listening to invalidations in this process.
+
+        A cache that is not listening cannot be trusted, so it is cleared
+        every time the listener (re)starts.
+        """
+        if self._pid == os.getpid() and self._thread is not None and \
+           self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and \
+               self._thread.is_alive():
+                return
+            pubsub = db_con.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._handle})
+            self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            self._pid = os.getpid()
+            self.cache.clear()
+
+    def publish(self, key):
+        """Method used to invalidate a key in every process.
+
+        Parameters:
+            key (string): Key of the entry.
+        """
+        self.cache.invalidate(key)
+        db_con.publish(self.channel, key)
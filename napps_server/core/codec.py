@@ -0,0 +1,167 @@
+"""Module with the codec of the structured fields stored in redis hashes.
+
+Redis hashes only hold strings, so fields such as the tags of a napp or the
+enabled flag of a user are encoded. Encoded values start with a format marker
+followed by the payload (``j1:`` and JSON, for now), so the format can change
+without breaking the values already stored.
+
+Values written before the codec existed (Python literals such as
+``['a', 'b']`` or ``True``) are still decoded, safely, by
+:func:`ast.literal_eval`, and can be rewritten with :func:`migrate`.
+"""
+import argparse
+import ast
+import json
+import sys
+import time
+
+from napps_server import config
+
+db_con = config.DB_CON
+
+#: Marker of the current format: JSON.
+FORMAT = 'j1:'
+
+#: Values so common that they skip the JSON decoder.
+_CONSTANTS = {FORMAT + 'true': True, FORMAT + 'false': False,
+              FORMAT + 'null': None}
+
+#: Legacy values so common that they skip literal_eval.
+_LEGACY_CONSTANTS = {'True': True, 'False': False, 'None': None}
+
+#: Returned for legacy values that cannot be decoded, so they are kept.
+_UNDECODABLE = object()
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+_decoder = json.JSONDecoder()
+
+
+def encode(value):
+    """Method used to encode a value to be stored in a redis hash.
+
+    Parameters:
+        value: JSON serializable value (list, bool, number, string...).
+
+    Returns:
+        encoded (string): Format marker followed by the payload.
+    """
+    return FORMAT + _encoder.encode(value)
+
+
+def is_encoded(raw):
+    """Method used to check if a stored value uses the current format."""
+    return isinstance(raw, str) and raw.startswith(FORMAT)
+
+
+def decode(raw, default=None):
+    """Method used to decode a value read from a redis hash.
+
+    Parameters:
+        raw (string): Value stored, in the current or in the legacy format.
+        default: Value returned for missing or undecodable values.
+
+    Returns:
+        value: The value decoded.
+    """
+    if raw is None or raw == '':
+        return default
+    if raw in _CONSTANTS:
+        return _CONSTANTS[raw]
+    if raw.startswith(FORMAT):
+        try:
+            return _decoder.decode(raw[len(FORMAT):])
+        except ValueError:
+            return default
+    return _decode_legacy(raw, default)
+
+
+def _decode_legacy(raw, default=None):
+    """Decode a Python literal stored before the codec existed."""
+    if raw in _LEGACY_CONSTANTS:
+        return _LEGACY_CONSTANTS[raw]
+    if raw == '[]':
+        return []
+    try:
+        return ast.literal_eval(raw)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return default
+
+
+def migrate(set_key, fields, batch_size=500):
+    """Method used to rewrite the legacy fields of the hashes of a set.
+
+    Keys are read from the set with SSCAN, so the migration streams through
+    any number of keys. Each batch costs one pipeline to read the fields and
+    one to write the ones still in the legacy format. Running it again is
+    harmless.
+
+    Parameters:
+        set_key (string): Redis set with the hash keys (e.g. 'napps').
+        fields (iterable): Encoded fields of those hashes.
+        batch_size (int): Number of keys per batch.
+
+    Returns:
+        stats (dict): Number of keys scanned and of keys and fields rewritten.
+    """
+    fields = list(fields)
+    stats = {'keys': 0, 'rewritten_keys': 0, 'rewritten_fields': 0}
+    batch = []
+    for key in db_con.sscan_iter(set_key, count=batch_size):
+        batch.append(key)
+        if len(batch) == batch_size:
+            _migrate_batch(batch, fields, stats)
+            batch = []
+    if batch:
+        _migrate_batch(batch, fields, stats)
+    return stats
+
+
+def _migrate_batch(keys, fields, stats):
+    """Rewrite the legacy fields of a batch of hashes."""
+    pipe = db_con.pipeline(transaction=False)
+    for key in keys:
+        pipe.hmget(key, fields)
+    results = pipe.execute()
+
+    pipe = db_con.pipeline(transaction=False)
+    for key, values in zip(keys, results):
+        stats['keys'] += 1
+        changed = {}
+        for field, raw in zip(fields, values):
+            if raw in (None, '') or is_encoded(raw):
+                continue
+            value = _decode_legacy(raw, _UNDECODABLE)
+            if value is not _UNDECODABLE:
+                changed[field] = encode(value)
+        if changed:
+            pipe.hmset(key, changed)
+            stats['rewritten_keys'] += 1
+            stats['rewritten_fields'] += len(changed)
+    pipe.execute()
+
+
+def main(argv=None):
+    """Rewrite the napps and users fields stored in the legacy format."""
+    # Imported here: the models use this module.
+    from napps_server.core.models import Napp, User
+
+    parser = argparse.ArgumentParser(
+        prog='napps-server migrate',
+        description='Rewrite the napps and users fields stored in the legacy '
+                    'format.')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='keys per pipeline (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    for set_key, fields in (('napps', Napp.encoded_fields()),
+                            ('users', User.encoded_fields())):
+        start = time.perf_counter()
+        stats = migrate(set_key, fields, args.batch_size)
+        print('{}: {keys} keys scanned, {rewritten_fields} fields of '
+              '{rewritten_keys} keys rewritten in {:.2f}s.'.format(
+                  set_key, time.perf_counter() - start, **stats))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,396 @@
+"""Module with the redis connection shared by the napps-server modules.
+
+:class:`RedisConnection` is a drop-in replacement of a redis client, created
+at import time but connected only when first used. Each process gets its own
+connection pool: a worker forked from a process that already used redis never
+shares its sockets.
+
+:class:`RedisRouter` is also a drop-in replacement of a redis client, sending
+reads to replicas and writes to the primary. Any object with the redis client
+API may be used as primary or replica, e.g. an in-memory stand-in in tests.
+"""
+import contextlib
+import contextvars
+import itertools
+import os
+import threading
+import time
+
+import redis
+import redis.asyncio
+from redis.exceptions import ConnectionError, RedisError, TimeoutError
+
+
+class RedisConnection(object):
+    """Lazy, fork-safe redis client with a bounded connection pool."""
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None,
+                 unix_socket_path=None, max_connections=50, pool_timeout=20,
+                 socket_timeout=None, socket_connect_timeout=None,
+                 socket_keepalive=False, health_check_interval=0):
+        """Constructor of RedisConnection class.
+
+        Parameters:
+            host (string): Redis host, ignored if unix_socket_path is set.
+            port (int): Redis port, ignored if unix_socket_path is set.
+            db (int): Redis database number.
+            password (string): Redis password, if any.
+            unix_socket_path (string): Path of the redis unix socket.
+            max_connections (int): Maximum number of connections per process.
+            pool_timeout (float): Seconds to wait for a free connection when
+                                  all of them are in use.
+            socket_timeout (float): Seconds to wait for a reply.
+            socket_connect_timeout (float): Seconds to wait to connect.
+            socket_keepalive (bool): Enable TCP keepalive.
+            health_check_interval (int): Idle seconds after which a connection
+                                         is checked with a PING before use.
+        """
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.connection_kwargs = {
+            'db': int(db),
+            'password': password,
+            'socket_timeout': socket_timeout,
+            'socket_connect_timeout': socket_connect_timeout,
+            'health_check_interval': health_check_interval,
+            'decode_responses': True,
+            'encoding': 'utf-8'}
+        if unix_socket_path:
+            self.connection_class = redis.UnixDomainSocketConnection
+            self.connection_kwargs['path'] = unix_socket_path
+            self.address = 'unix://' + unix_socket_path
+        else:
+            self.connection_class = redis.Connection
+            self.connection_kwargs.update(host=host, port=int(port),
+                                          socket_keepalive=socket_keepalive)
+            self.address = 'redis://{}:{}'.format(host, port)
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        """Forget the client of the parent process, without closing it."""
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+
+    def _get_client(self):
+        """Return the client of the current process, creating it if needed."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    pool = redis.BlockingConnectionPool(
+                        max_connections=self.max_connections,
+                        timeout=self.pool_timeout,
+                        connection_class=self.connection_class,
+                        **self.connection_kwargs)
+                    self._client = redis.StrictRedis(connection_pool=pool)
+                    self._pid = os.getpid()
+        return self._client
+
+    def __getattr__(self, name):
+        """Delegate the redis commands (get, pipeline, pubsub...)."""
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._get_client(), name)
+
+    def reset(self):
+        """Method used to drop the connections of the current process.
+
+        The next command opens new ones. Preforking servers may call it after
+        a fork, although the pid check already makes it unnecessary.
+        """
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.connection_pool.disconnect()
+            self._client = None
+            self._pid = None
+
+    def async_client(self):
+        """Method used to create an asyncio client with the same settings.
+
+        The client is bound to the running event loop, so each loop must
+        create its own one and close it when done.
+
+        Returns:
+            client (:class:`redis.asyncio.Redis`): The asyncio client.
+        """
+        if self.connection_class is redis.UnixDomainSocketConnection:
+            connection_class = redis.asyncio.UnixDomainSocketConnection
+        else:
+            connection_class = redis.asyncio.Connection
+        pool = redis.asyncio.BlockingConnectionPool(
+            max_connections=self.max_connections, timeout=self.pool_timeout,
+            connection_class=connection_class, **self.connection_kwargs)
+        return redis.asyncio.Redis(connection_pool=pool)
+
+    def pool_stats(self):
+        """Method used to report the usage of the connection pool.
+
+        Returns:
+            stats (dict): Address, pid, maximum, created, in use and idle
+                          connections of the pool of the current process.
+        """
+        stats = {'address': self.address, 'pid': os.getpid(),
+                 'max_connections': self.max_connections, 'created': 0,
+                 'in_use': 0, 'idle': 0}
+        if self._client is None or self._pid != os.getpid():
+            return stats
+        pool = self._client.connection_pool
+        created = len(pool._connections)
+        idle = sum(1 for connection in list(pool.pool.queue)
+                   if connection is not None)
+        stats.update(created=created, in_use=created - idle, idle=idle)
+        return stats
+
+
+#: Commands that only read, so they may be sent to a replica.
+READ_COMMANDS = frozenset([
+    'exists', 'get', 'getrange', 'hexists', 'hget', 'hgetall', 'hkeys',
+    'hlen', 'hmget', 'hscan', 'hscan_iter', 'hvals', 'keys', 'lindex', 'llen',
+    'lrange', 'mget', 'pttl', 'scan', 'scan_iter', 'scard', 'sdiff', 'sinter',
+    'sismember', 'smembers', 'srandmember', 'sscan', 'sscan_iter', 'strlen',
+    'sunion', 'ttl', 'type', 'zcard', 'zcount', 'zrange', 'zrangebylex',
+    'zrangebyscore', 'zrank', 'zrevrange', 'zrevrangebylex',
+    'zrevrangebyscore', 'zrevrank', 'zscore'])
+
+#: Attributes that neither read nor write data.
+NEUTRAL_ATTRIBUTES = frozenset(['async_client', 'connection_pool', 'info',
+                                'ping', 'pool_stats', 'pubsub', 'reset'])
+
+#: Whether the current request (or thread, outside requests) wrote to the
+#: primary, so its reads must not go to a possibly outdated replica.
+_wrote = contextvars.ContextVar('napps_server_redis_wrote', default=False)
+
+
+def start_request():
+    """Method used to forget the writes of the previous request.
+
+    It must be called at the beginning of each request, since the threads of
+    the server are reused.
+    """
+    _wrote.set(False)
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Method used to send the reads of a block to the primary.
+
+    Values cached beyond the current request (e.g. after an invalidation)
+    must not be read from a replica, which may not have the latest writes.
+    """
+    token = _wrote.set(True)
+    try:
+        yield
+    finally:
+        _wrote.reset(token)
+
+
+class Replica(object):
+    """A read replica and the result of its last lag check."""
+
+    def __init__(self, client, primary, max_lag, check_interval,
+                 timer=time.monotonic):
+        """Constructor of Replica class.
+
+        Parameters:
+            client: Redis client of the replica.
+            primary: Redis client of the primary.
+            max_lag (int): Bytes of the replication stream the replica may
+                           not have processed yet to be used.
+            check_interval (float): Seconds between lag checks.
+            timer (callable): Clock used to schedule the checks.
+        """
+        self.client = client
+        self.primary = primary
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.timer = timer
+        self.healthy = False
+        self.lag = None
+        self._checked_at = None
+
+    def _check(self):
+        """Read the replication state of the replica and of the primary.
+
+        The replica is read first, so the lag is never underestimated.
+        """
+        info = self.client.info('replication')
+        if info.get('master_link_status') != 'up' or \
+           info.get('master_sync_in_progress'):
+            self.lag = None
+            return False
+        offset = self.primary.info('replication')['master_repl_offset']
+        self.lag = max(offset - info['slave_repl_offset'], 0)
+        return self.lag <= self.max_lag
+
+    def is_usable(self):
+        """Method used to check if reads may be sent to the replica.
+
+        The replication offsets (INFO replication) of the replica and of the
+        primary are compared at most once per check interval.
+
+        Returns:
+            usable (bool): False if the replica is unreachable, lost its link
+                           with the primary or lags behind it.
+        """
+        now = self.timer()
+        if self._checked_at is None or \
+           now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            try:
+                self.healthy = self._check()
+            except (RedisError, KeyError):
+                self.lag = None
+                self.healthy = False
+        return self.healthy
+
+    def mark_down(self):
+        """Method used to stop using the replica until the next check."""
+        self.healthy = False
+        self._checked_at = self.timer()
+
+
+class RedisRouter(object):
+    """Redis client sending reads to replicas and writes to the primary.
+
+    Once a request writes, its following reads also go to the primary, so it
+    always reads its own writes. Replicas that lag or fail are skipped, and
+    reads fall back to the primary when no replica is usable.
+    """
+
+    def __init__(self, primary, replicas=(), max_lag=1024 * 1024,
+                 check_interval=1):
+        """Constructor of RedisRouter class.
+
+        Parameters:
+            primary: Redis client of the primary, e.g. a RedisConnection.
+            replicas (list): Redis clients of the replicas.
+            max_lag (int): Bytes of the replication stream a replica may not
+                           have processed yet to be used.
+            check_interval (float): Seconds between lag checks of a replica.
+        """
+        self.primary = primary
+        self.replicas = [Replica(client, primary, max_lag, check_interval)
+                         for client in replicas]
+        self._next = itertools.count()
+        self.address = getattr(primary, 'address', None)
+
+    def replica(self):
+        """Method used to choose the replica of a read.
+
+        Returns:
+            replica (:class:`Replica`): A usable replica, in turns, or None
+                if reads must go to the primary.
+        """
+        if _wrote.get() or not self.replicas:
+            return None
+        start = next(self._next)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if replica.is_usable():
+                return replica
+        return None
+
+    def _read(self, name):
+        """Build a read command, sent to a replica when possible."""
+        def command(*args, **kwargs):
+            replica = self.replica()
+            if replica is not None:
+                try:
+                    return getattr(replica.client, name)(*args, **kwargs)
+                except (ConnectionError, TimeoutError):
+                    replica.mark_down()
+            return getattr(self.primary, name)(*args, **kwargs)
+        return command
+
+    def __getattr__(self, name):
+        """Route the redis commands."""
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name in READ_COMMANDS:
+            return self._read(name)
+        if name not in NEUTRAL_ATTRIBUTES:
+            _wrote.set(True)
+        return getattr(self.primary, name)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        """Method used to create a pipeline, routed when executed."""
+        return RoutedPipeline(self, transaction, shard_hint)
+
+    def pool_stats(self):
+        """Method used to report the usage of the connection pools.
+
+        Returns:
+            stats (dict): Usage of the pool of the primary, with the usage of
+                          the pools of the replicas in 'replicas'.
+        """
+        stats = self.primary.pool_stats()
+        stats['replicas'] = [dict(replica.client.pool_stats(),
+                                  healthy=replica.healthy, lag=replica.lag)
+                             for replica in self.replicas]
+        return stats
+
+
+class RoutedPipeline(object):
+    """Pipeline sent to a replica if all its commands are reads."""
+
+    def __init__(self, router, transaction=True, shard_hint=None):
+        """Constructor of RoutedPipeline class.
+
+        Parameters:
+            router (:class:`RedisRouter`): Router of the pipeline.
+            transaction (bool): Run the commands in a MULTI/EXEC transaction.
+            shard_hint: Passed to the redis pipeline.
+        """
+        self.router = router
+        self.transaction = transaction
+        self.shard_hint = shard_hint
+        self.commands = []
+
+    def __len__(self):
+        """Return the number of queued commands."""
+        return len(self.commands)
+
+    def __getattr__(self, name):
+        """Queue a redis command."""
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return command
+
+    def _run(self, client, commands):
+        """Run the commands in a pipeline of the given client."""
+        pipe = client.pipeline(self.transaction, self.shard_hint)
+        for name, args, kwargs in commands:
+            getattr(pipe, name)(*args, **kwargs)
+        return pipe.execute()
+
+    def execute(self):
+        """Method used to send the queued commands.
+
+        Returns:
+            results (list): The result of each command.
+        """
+        commands, self.commands = self.commands, []
+        if not commands:
+            return []
+        if all(name in READ_COMMANDS for name, _, _ in commands):
+            replica = self.router.replica()
+            if replica is not None:
+                try:
+                    return self._run(replica.client, commands)
+                except (ConnectionError, TimeoutError):
+                    replica.mark_down()
+        else:
+            _wrote.set(True)
+        return self._run(self.router.primary, commands)
+
+    def reset(self):
+        """Method used to drop the queued commands."""
+        self.commands = []
@@ -0,0 +1,133 @@
+"""Module used to verify user credentials.
+
+bcrypt verifications run in a bounded pool of worker threads, so bursts of
+logins cannot take every request thread. Successful verifications are kept for
+a short time in a memory-only cache whose keys are HMACs of the credentials,
+computed with a secret that never leaves this process.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+from napps_server import config
+from napps_server.core.cache import TTLCache
+from napps_server.core.exceptions import CredentialsTimeout
+
+#: Credentials verified recently, indexed by their keyed hash.
+verified = TTLCache(config.AUTH_CACHE_SIZE, config.AUTH_CACHE_TTL)
+
+_secret = os.urandom(32)
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """Method used to return the pool of bcrypt workers of this process.
+
+    The pool is created lazily, so forked processes get their own one.
+
+    Returns:
+        executor (:class:`concurrent.futures.ThreadPoolExecutor`):
+            Pool used to run bcrypt.
+    """
+    global _executor, _executor_pid  # pylint: disable=global-statement
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=config.BCRYPT_WORKERS,
+                    thread_name_prefix='bcrypt')
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _cache_key(username, password, hashed):
+    """Build the keyed hash of the credentials.
+
+    The stored password hash is part of the key, so a password change makes
+    previous entries useless.
+    """
+    message = b'\0'.join([username.encode('utf-8'),
+                          password.encode('utf-8'), hashed])
+    return hmac.new(_secret, message, hashlib.sha256).hexdigest()
+
+
+def check_password(username, password, hashed):
+    """Method used to verify a password against its bcrypt hash.
+
+    Parameters:
+        username (string): Name of user registered.
+        password (string): Password sent by the user.
+        hashed (bytes): bcrypt hash stored for the user.
+    Returns:
+        result (bool): True if the password matches the hash.
+    Raises:
+        CredentialsTimeout: If no worker verified it within BCRYPT_TIMEOUT.
+    """
+    key = _cache_key(username, password, hashed)
+    if verified.get(key):
+        return True
+
+    future = executor().submit(bcrypt.checkpw, password.encode('utf-8'),
+                               hashed)
+    try:
+        result = future.result(timeout=config.BCRYPT_TIMEOUT)
+    except FutureTimeoutError:
+        # Do not leave the verification queued once nobody waits for it.
+        future.cancel()
+        raise CredentialsTimeout('Too many credentials being verified.')
+    if result:
+        verified.set(key, True)
+    return result
+
+
+async def check_password_async(username, password, hashed):
+    """Method used to verify a password without blocking the event loop.
+
+    Same as :func:`check_password`, for asyncio applications: bcrypt runs in
+    the same pool of workers, which the event loop awaits.
+
+    Parameters:
+        username (string): Name of user registered.
+        password (string): Password sent by the user.
+        hashed (bytes): bcrypt hash stored for the user.
+    Returns:
+        result (bool): True if the password matches the hash.
+    Raises:
+        CredentialsTimeout: If no worker verified it within BCRYPT_TIMEOUT.
+    """
+    key = _cache_key(username, password, hashed)
+    if verified.get(key):
+        return True
+
+    future = asyncio.get_running_loop().run_in_executor(
+        executor(), bcrypt.checkpw, password.encode('utf-8'), hashed)
+    try:
+        # On timeout, the future is cancelled, which also cancels the
+        # verification if it is still queued.
+        result = await asyncio.wait_for(future, config.BCRYPT_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise CredentialsTimeout('Too many credentials being verified.')
+    if result:
+        verified.set(key, True)
+    return result
+
+
+def hash_password(password):
+    """Method used to hash a new password with bcrypt.
+
+    Parameters:
+        password (string): Password to be hashed.
+    Returns:
+        hashed (bytes): bcrypt hash of the password.
+    """
+    future = executor().submit(bcrypt.hashpw, password.encode('utf-8'),
+                               bcrypt.gensalt())
+    return future.result(timeout=config.BCRYPT_TIMEOUT)
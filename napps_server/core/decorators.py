@@ -1,12 +1,15 @@
 """Module with main decorators used by napps-server."""
 from functools import wraps
 
-from flask import Response, jsonify, request
+from flask import Response, g, request
 from jsonschema import ValidationError, validate
 
-from napps_server.core.exceptions import NappsEntryDoesNotExists
+from napps_server.core.exceptions import (CredentialsTimeout,
+                                          NappsEntryDoesNotExists)
 from napps_server.core.models import Token, User
-from napps_server.core.utils import authenticate, get_request_data
+from napps_server.core.serialization import json_response
+from napps_server.core.utils import (authenticate, get_request_data,
+                                     unavailable)
 
 
 def validate_json(f):
@@ -16,7 +19,8 @@ def validate_json(f):
         """Wrapper called to validate a json from request."""
         if request.form is None and request.get_json() is None and \
                 request.get_data() is None:
-            return jsonify({'error': "Payload must be a valid json"}), 400
+            return json_response({'error': "Payload must be a valid json"},
+                                 400)
         return f(*args, **kwargs)
     return wrapper
 
@@ -39,14 +43,37 @@ def validate_schema(schema):
     return decorator
 
 
+def check_request_auth():
+    """Method used to verify the basic auth credentials of the request.
+
+    The result is kept for the rest of the request, so the same credentials
+    are never verified twice.
+
+    Returns:
+        result (bool): True if the credentials are valid.
+    Raises:
+        CredentialsTimeout: If the credentials could not be verified in time.
+    """
+    auth = request.authorization
+    if not auth:
+        return False
+    credentials = (auth.username, auth.password)
+    if g.get('auth_credentials') != credentials:
+        g.auth_result = User.check_auth(auth.username, auth.password)
+        g.auth_credentials = credentials
+    return g.auth_result
+
+
 def requires_auth(f):
     """Method used to handle user authentication."""
     @wraps(f)
     def wrapper(*args, **kwargs):
         """Wrapper to verify the user authentication."""
-        auth = request.authorization
-        if not auth or not User.check_auth(auth.username, auth.password):
-            return authenticate()
+        try:
+            if not check_request_auth():
+                return authenticate()
+        except CredentialsTimeout:
+            return unavailable()
         return f(*args, **kwargs)
     return wrapper
 
@@ -63,15 +90,22 @@ def requires_token(f):
             token = content.get('token', None)
 
         try:
-            token = Token.get(token)
-            if not token or not token.is_valid():
+            if not token:
                 raise NappsEntryDoesNotExists
+            user = Token.owner(token)
         except NappsEntryDoesNotExists:
             return authenticate()
         except (KeyError, TypeError):
             return Response("Invalid request", 400)
 
-        # Otherwise just send them where they wanted to go
-        return f(token.user, *args, **kwargs)
+        # Otherwise just send them where they wanted to go. The user is only
+        # loaded if the endpoint needs more than its username.
+        try:
+            return f(user, *args, **kwargs)
+        except NappsEntryDoesNotExists:
+            # The owner of the token was deleted
+            if user.missing:
+                return authenticate()
+            raise
 
     return wrapper
@@ -25,6 +25,12 @@ class InvalidUser(Exception):
     pass
 
 
+class CredentialsTimeout(Exception):
+    """Exception thrown when the bcrypt workers are too busy to verify."""
+
+    pass
+
+
 class RepositoryNotReachable(Exception):
     """Exception thrown when repository can be found."""
 
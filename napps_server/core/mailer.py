@@ -0,0 +1,211 @@
+"""Module used to send emails out of the request path.
+
+Emails are pushed to a durable outbox (a redis list) by the request handlers
+and sent by a separate worker process, which drains the outbox in batches
+over a reused SMTP connection. Failed emails are retried with exponential
+backoff and moved to a dead letter list after too many attempts.
+
+The worker can be tested against a local SMTP stand-in, e.g.::
+
+    $ python3 -m aiosmtpd -n -l localhost:8025
+    $ napps-mailer --host localhost --port 8025
+"""
+import argparse
+import json
+import smtplib
+import sys
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from napps_server import config
+
+db_con = config.DB_CON
+
+OUTBOX_KEY = 'outbox:email'
+PROCESSING_KEY = 'outbox:email:processing'
+RETRY_KEY = 'outbox:email:retry'
+DEAD_KEY = 'outbox:email:dead'
+
+
+def enqueue(recipient, subject, html):
+    """Method used to push an email to the outbox.
+
+    Parameters:
+        recipient (string): Email address of the recipient.
+        subject (string): Subject of the email.
+        html (string): Body of the email.
+    """
+    message = {'to': recipient, 'subject': subject, 'html': html,
+               'attempts': 0}
+    db_con.lpush(OUTBOX_KEY, json.dumps(message))
+
+
+def requeue_processing():
+    """Method used to push back emails left in process by a dead worker.
+
+    Returns:
+        count (int): Number of emails pushed back to the outbox.
+    """
+    count = 0
+    while db_con.rpoplpush(PROCESSING_KEY, OUTBOX_KEY) is not None:
+        count += 1
+    return count
+
+
+class MailWorker(object):
+    """Class used to drain the outbox over a persistent SMTP connection."""
+
+    def __init__(self, host=None, port=None, batch_size=None,
+                 max_attempts=None, backoff=None, idle_timeout=30):
+        """Constructor of MailWorker class.
+
+        Parameters:
+            host (string): SMTP server host.
+            port (int): SMTP server port.
+            batch_size (int): Maximum number of emails taken at once.
+            max_attempts (int): Attempts before an email is given up.
+            backoff (float): Delay before the first retry, in seconds. It is
+                             doubled at each new attempt.
+            idle_timeout (float): Seconds without emails after which the SMTP
+                                  connection is closed.
+        """
+        self.host = host or config.SMTP_HOST
+        self.port = port or config.SMTP_PORT
+        self.batch_size = batch_size or config.MAILER_BATCH_SIZE
+        self.max_attempts = max_attempts or config.MAILER_MAX_ATTEMPTS
+        self.backoff = backoff or config.MAILER_BACKOFF
+        self.idle_timeout = idle_timeout
+        self.sent = 0
+        self.failed = 0
+        self._smtp = None
+        self._last_used = 0
+
+    def _connection(self):
+        """Return the SMTP connection, opening it if needed."""
+        if self._smtp is None:
+            self._smtp = smtplib.SMTP(self.host, self.port,
+                                      timeout=config.SMTP_TIMEOUT)
+        self._last_used = time.monotonic()
+        return self._smtp
+
+    def close(self):
+        """Method used to close the SMTP connection, if open."""
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def _promote_retries(self):
+        """Move the emails whose retry is due back to the outbox."""
+        for raw in db_con.zrangebyscore(RETRY_KEY, 0, time.time()):
+            # Only the worker that removes the entry pushes it back.
+            if db_con.zrem(RETRY_KEY, raw):
+                db_con.lpush(OUTBOX_KEY, raw)
+
+    def _next_batch(self, timeout):
+        """Take up to batch_size emails from the outbox."""
+        raw = db_con.brpoplpush(OUTBOX_KEY, PROCESSING_KEY, timeout)
+        if raw is None:
+            return []
+        batch = [raw]
+        while len(batch) < self.batch_size:
+            raw = db_con.rpoplpush(OUTBOX_KEY, PROCESSING_KEY)
+            if raw is None:
+                break
+            batch.append(raw)
+        return batch
+
+    def _send(self, message):
+        """Send a single email over the persistent connection."""
+        mime = MIMEMultipart('alternative')
+        mime['Subject'] = message['subject']
+        mime['From'] = config.MAIL_FROM
+        mime['To'] = message['to']
+        mime.attach(MIMEText(message['html'], 'html'))
+        self._connection().sendmail(config.MAIL_FROM, message['to'],
+                                    mime.as_string())
+
+    def _retry(self, raw, message, permanent=False):
+        """Schedule a new attempt of an email, or give it up."""
+        message['attempts'] += 1
+        pipe = db_con.pipeline()
+        pipe.lrem(PROCESSING_KEY, 1, raw)
+        if permanent or message['attempts'] >= self.max_attempts:
+            pipe.lpush(DEAD_KEY, json.dumps(message))
+            self.failed += 1
+        else:
+            delay = self.backoff * 2 ** (message['attempts'] - 1)
+            pipe.zadd(RETRY_KEY, {json.dumps(message): time.time() + delay})
+        pipe.execute()
+
+    def run_once(self, timeout=1):
+        """Method used to send one batch of emails.
+
+        Parameters:
+            timeout (int): Seconds to wait for an email.
+
+        Returns:
+            count (int): Number of emails taken from the outbox.
+        """
+        self._promote_retries()
+        batch = self._next_batch(timeout)
+        for raw in batch:
+            message = json.loads(raw)
+            try:
+                self._send(message)
+            except smtplib.SMTPRecipientsRefused:
+                self._retry(raw, message, permanent=True)
+            except (smtplib.SMTPException, OSError):
+                self.close()
+                self._retry(raw, message)
+            else:
+                db_con.lrem(PROCESSING_KEY, 1, raw)
+                self.sent += 1
+
+        if not batch and self._smtp is not None and \
+           time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+        return len(batch)
+
+    def run(self):
+        """Method used to drain the outbox forever."""
+        try:
+            while True:
+                self.run_once()
+        finally:
+            self.close()
+
+
+def main(argv=None):
+    """Run the email worker."""
+    parser = argparse.ArgumentParser(
+        description='Send the emails queued by napps-server.')
+    parser.add_argument('--host', help='SMTP server host')
+    parser.add_argument('--port', type=int, help='SMTP server port')
+    parser.add_argument('--batch-size', type=int,
+                        help='maximum number of emails taken at once')
+    parser.add_argument('--once', action='store_true',
+                        help='send a single batch and exit')
+    parser.add_argument('--recover', action='store_true',
+                        help='requeue emails left in process by a dead worker'
+                             ' before starting')
+    args = parser.parse_args(argv)
+
+    if args.recover:
+        print('{} email(s) requeued.'.format(requeue_processing()))
+
+    worker = MailWorker(args.host, args.port, args.batch_size)
+    if args.once:
+        worker.run_once()
+        worker.close()
+        print('{} sent, {} given up.'.format(worker.sent, worker.failed))
+    else:
+        worker.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,531 @@
+"""Module with the metrics of napps-server, in the Prometheus text format.
+
+Metrics are updated in the memory of each process: an update costs a lock and
+a dictionary lookup, so they are always collected. Every METRICS_FLUSH_INTERVAL
+seconds, a thread of each worker process adds what changed to redis, so any
+worker answering GET /metrics reports the whole deployment:
+
+- counters and histograms are summed over every worker, past and present, in
+  the ``metrics:<name>`` hashes;
+- gauges are reported by each live worker, with a ``worker`` label
+  (``<hostname>:<pid>``), from the ``metrics:worker:<worker>`` hashes, which
+  expire when the worker stops. The live workers are listed in the
+  ``metrics:workers`` sorted set.
+
+A single scrape target is enough, whatever the number of workers and hosts.
+"""
+import atexit
+import bisect
+import json
+import os
+import socket
+import threading
+import time
+
+from redis.exceptions import RedisError
+
+from napps_server import config
+
+#: Content type of the text exposition format.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+#: Redis key of the sorted set of live workers, scored by their last flush.
+WORKERS_KEY = 'metrics:workers'
+
+
+def _format_labels(pairs):
+    """Format the labels of a sample, e.g. {method="GET",status="200"}."""
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    """Format a sample value or a bucket bound."""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and \
+       abs(value) < 2 ** 53:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _field(labels):
+    """Build the redis hash field of a set of label values."""
+    return json.dumps(list(labels))
+
+
+def _labels(field):
+    """Read the label values of a redis hash field."""
+    return tuple(json.loads(field))
+
+
+class Metric(object):
+    """Base class of the metrics, holding a value per set of label values."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        """Constructor of Metric class.
+
+        Parameters:
+            name (string): Name of the metric.
+            documentation (string): Help text of the metric.
+            labels (tuple): Names of the labels of the metric.
+            function (callable): Called when collected, returning the values
+                indexed by tuples of label values, or a number if the metric
+                has no labels. Such metrics are never updated otherwise.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.function = function
+        self._values = {}
+        self._flushed = {}
+        self._lock = threading.Lock()
+
+    def _add(self, labels, amount):
+        """Add an amount to the value of the given label values."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self):
+        """Method used to read the values of the current process.
+
+        Returns:
+            values (dict): Values indexed by tuples of label values.
+        """
+        if self.function is not None:
+            values = self.function()
+            return values if isinstance(values, dict) else {(): values}
+        with self._lock:
+            return dict(self._values)
+
+    def deltas(self):
+        """Method used to read what changed since the last flush.
+
+        Returns:
+            deltas (tuple): Amount added to each redis hash field, and the
+                values to give to :meth:`flushed` once they are stored.
+        """
+        values = self.values()
+        deltas = {}
+        for key, value in values.items():
+            delta = value - self._flushed.get(key, 0)
+            if delta:
+                deltas[_field(key)] = delta
+        return deltas, values
+
+    def flushed(self, values):
+        """Method used to remember the values stored in redis."""
+        self._flushed = values
+
+    def load(self, fields):
+        """Method used to read the values stored in a redis hash.
+
+        Returns:
+            values (dict): Values indexed by tuples of label values.
+        """
+        values = {_labels(field): float(value)
+                  for field, value in fields.items()}
+        if not values and not self.labels:
+            values[()] = 0
+        return values
+
+    def samples(self, values, labels):
+        """Method used to build the samples of the metric.
+
+        Returns:
+            samples (list): Name suffix, label pairs and value of each sample.
+        """
+        return [('', list(zip(labels, key)), value)
+                for key, value in sorted(values.items())]
+
+    def render(self, values, labels=None):
+        """Method used to render the metric in the text format.
+
+        Parameters:
+            values (dict): Values indexed by tuples of label values.
+            labels (tuple): Names of the labels. Defaults to the metric ones.
+
+        Returns:
+            lines (list): HELP and TYPE lines followed by the samples.
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        for suffix, pairs, value in self.samples(values, labels or
+                                                 self.labels):
+            lines.append('{}{}{} {}'.format(self.name, suffix,
+                                            _format_labels(pairs),
+                                            _format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    """Metric that only goes up, summed over every worker."""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        """Method used to increment the counter of the given label values."""
+        self._add(labels, amount)
+
+
+class Gauge(Metric):
+    """Metric that goes up and down, reported by each worker."""
+
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        """Method used to increment the gauge of the given label values."""
+        self._add(labels, amount)
+
+    def dec(self, *labels, amount=1):
+        """Method used to decrement the gauge of the given label values."""
+        self._add(labels, -amount)
+
+
+class Histogram(Metric):
+    """Metric counting observations in buckets, summed over every worker."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=None):
+        """Constructor of Histogram class.
+
+        Parameters:
+            buckets (list): Upper bounds of the buckets, in increasing order.
+                            METRICS_LATENCY_BUCKETS if not given.
+        """
+        super().__init__(name, documentation, labels)
+        buckets = buckets or config.METRICS_LATENCY_BUCKETS
+        self.buckets = tuple(float(bound) for bound in buckets) + \
+            (float('inf'),)
+
+    def observe(self, value, *labels):
+        """Method used to record an observation of the given label values.
+
+        Only the count of its bucket and the sum are updated, the cumulative
+        counts are computed when rendered.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * len(self.buckets) + [0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def values(self):
+        """Read the bucket counts and sum of each set of label values."""
+        with self._lock:
+            return {key: list(counts) for key, counts in self._values.items()}
+
+    def deltas(self):
+        """Read the bucket counts and sums added since the last flush.
+
+        Each bucket count and the sum have their own hash field, made of the
+        label values and the index of the bucket (the sum is the last one).
+        """
+        values = self.values()
+        deltas = {}
+        for key, counts in values.items():
+            flushed = self._flushed.get(key) or [0] * len(counts)
+            for index, (count, old) in enumerate(zip(counts, flushed)):
+                if count != old:
+                    deltas[_field(key + (index,))] = count - old
+        return deltas, values
+
+    def load(self, fields):
+        """Read the bucket counts and sums stored in a redis hash."""
+        values = {}
+        for field, value in fields.items():
+            key = _labels(field)
+            counts = values.setdefault(key[:-1],
+                                       [0] * (len(self.buckets) + 1))
+            counts[key[-1]] = float(value)
+        return values
+
+    def samples(self, values, labels):
+        """Build the _bucket, _sum and _count samples of each label set."""
+        samples = []
+        for key, counts in sorted(values.items()):
+            pairs = list(zip(labels, key))
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                samples.append(('_bucket',
+                                pairs + [('le', _format_value(bound))],
+                                total))
+            samples.append(('_sum', pairs, counts[-1]))
+            samples.append(('_count', pairs, total))
+        return samples
+
+
+class Registry(object):
+    """Metrics shared by the worker processes through redis."""
+
+    def __init__(self, db, interval=5):
+        """Constructor of Registry class.
+
+        Parameters:
+            db: Redis client where the metrics are stored.
+            interval (float): Seconds between flushes of each worker.
+        """
+        self.db = db
+        self.interval = interval
+        self.metrics = []
+        self.worker = None
+        self._lock = threading.Lock()
+        self._thread = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self._at_exit)
+
+    def register(self, metric):
+        """Method used to add a metric to the registry.
+
+        Returns:
+            metric (:class:`Metric`): The metric registered.
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def _after_fork(self):
+        """Forget the flush thread of the parent process."""
+        self._lock = threading.Lock()
+        self._thread = None
+        self.worker = None
+
+    def _at_exit(self):
+        """Flush the last changes of a process that started flushing."""
+        if self._thread is not None:
+            try:
+                self.flush()
+            except RedisError:
+                pass
+
+    def _run(self):
+        """Flush the metrics forever."""
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except RedisError:
+                # The changes are kept and flushed next time.
+                pass
+
+    def start(self):
+        """Method used to start flushing the metrics of the current process.
+
+        It is cheap to call on every request: the flush thread is created
+        once per process, including in worker processes forked after it.
+        """
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self.worker = self._worker_id()
+                    self._thread = threading.Thread(
+                        target=self._run, name='napps-metrics', daemon=True)
+                    self._thread.start()
+
+    def _worker_id(self):
+        """Return the worker label of the current process."""
+        return self.worker or '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    def _worker_key(self, worker):
+        """Build the redis key of the gauges of a worker."""
+        return 'metrics:worker:{}'.format(worker)
+
+    def _gauges(self):
+        """Read the gauges of this process, indexed by hash field."""
+        gauges = {}
+        for metric in self.metrics:
+            if isinstance(metric, Gauge):
+                for key, value in metric.values().items():
+                    gauges[_field((metric.name,) + key)] = value
+        return gauges
+
+    def flush(self, gauges=True):
+        """Method used to add the changes of this process to redis.
+
+        Counters and histograms are incremented by what changed since the
+        last flush, gauges of the worker are replaced.
+
+        Parameters:
+            gauges (bool): Also replace the gauges of the worker.
+        """
+        with self._lock:
+            flushed = []
+            pipe = self.db.pipeline(transaction=False)
+            for metric in self.metrics:
+                if isinstance(metric, Gauge):
+                    continue
+                deltas, values = metric.deltas()
+                for field, amount in deltas.items():
+                    pipe.hincrbyfloat('metrics:' + metric.name, field,
+                                      amount)
+                flushed.append((metric, values))
+
+            if gauges:
+                worker = self._worker_id()
+                key = self._worker_key(worker)
+                pipe.delete(key)
+                values = self._gauges()
+                if values:
+                    pipe.hset(key, mapping=values)
+                pipe.expire(key, int(self.interval * 3) + 1)
+                pipe.zadd(WORKERS_KEY, {worker: time.time()})
+            pipe.execute()
+            for metric, values in flushed:
+                metric.flushed(values)
+
+    def render(self):
+        """Method used to render the metrics of every worker.
+
+        The counters and histograms of this process are flushed first, so
+        they are included, and its gauges are read from memory: the scrape
+        itself must not stay in the gauges stored in redis.
+
+        Returns:
+            text (string): The metrics in the Prometheus text format.
+        Raises:
+            RedisError: If the metrics cannot be read from redis.
+        """
+        self.flush(gauges=False)
+        pipe = self.db.pipeline(transaction=False)
+        pipe.zremrangebyscore(WORKERS_KEY, '-inf',
+                              time.time() - self.interval * 3)
+        pipe.zrange(WORKERS_KEY, 0, -1)
+        shared = [metric for metric in self.metrics
+                  if not isinstance(metric, Gauge)]
+        for metric in shared:
+            pipe.hgetall('metrics:' + metric.name)
+        results = pipe.execute()
+        workers = results[1]
+        stored = dict(zip(shared, results[2:]))
+
+        current = self._worker_id()
+        workers = [worker for worker in workers if worker != current]
+        pipe = self.db.pipeline(transaction=False)
+        for worker in workers:
+            pipe.hgetall(self._worker_key(worker))
+        stored_gauges = pipe.execute() if workers else []
+
+        gauges = {}
+        for worker, fields in zip(workers + [current],
+                                  stored_gauges + [self._gauges()]):
+            for field, value in fields.items():
+                key = _labels(field)
+                gauges.setdefault(key[0], {})[(worker,) + key[1:]] = \
+                    float(value)
+
+        lines = []
+        for metric in self.metrics:
+            if isinstance(metric, Gauge):
+                lines.extend(metric.render(gauges.get(metric.name, {}),
+                                           ('worker',) + metric.labels))
+            else:
+                lines.extend(metric.render(metric.load(stored[metric])))
+        return '\n'.join(lines) + '\n'
+
+
+def _pool_connections():
+    """Read the connections of the redis pools of the current process."""
+    stats = config.DB_CON.pool_stats()
+    values = {}
+    for pool in [stats] + stats.get('replicas', []):
+        for state in ('in_use', 'idle'):
+            values[(pool['address'], state)] = pool[state]
+    return values
+
+
+registry = Registry(config.DB_CON, config.METRICS_FLUSH_INTERVAL)
+
+requests_in_flight = registry.register(Gauge(
+    'napps_http_requests_in_flight', 'Requests being handled.'))
+request_duration = registry.register(Histogram(
+    'napps_http_request_duration_seconds', 'Time spent handling requests.',
+    ('method', 'route')))
+responses = registry.register(Counter(
+    'napps_http_responses_total', 'Responses sent.',
+    ('method', 'route', 'status')))
+response_bytes = registry.register(Counter(
+    'napps_http_response_bytes_total', 'Bytes of the response bodies sent.',
+    ('method', 'route')))
+model_operations = registry.register(Counter(
+    'napps_model_operations_total', 'Operations of the model layer.',
+    ('operation',)))
+redis_connections = registry.register(Gauge(
+    'napps_redis_pool_connections', 'Connections of the redis pools.',
+    ('address', 'state'), function=_pool_connections))
+
+
+def count(operation):
+    """Method used to count an operation of the model layer.
+
+    Parameters:
+        operation (string): Name of the operation, e.g. 'User.get'.
+    """
+    model_operations.inc(operation)
+
+
+def observe_request(method, route, status, seconds, size=None):
+    """Method used to record a request handled.
+
+    Parameters:
+        method (string): HTTP method of the request.
+        route (string): Route of the request, e.g. '/napps/<username>/'.
+        status (int): HTTP status code of the response.
+        seconds (float): Time spent handling the request.
+        size (int): Bytes of the response body, if known.
+    """
+    request_duration.observe(seconds, method, route)
+    responses.inc(method, route, str(status))
+    if size:
+        response_bytes.inc(method, route, amount=size)
+
+
+def instrument(app):
+    """Method used to record the requests handled by a Flask application.
+
+    Requests are labelled by the rule of their endpoint, or 'unmatched'.
+    Responses not sent because of an unhandled error are counted as 500.
+
+    Parameters:
+        app (:class:`flask.Flask`): The application.
+    """
+    from flask import g, request
+
+    def start():
+        """Count the request in flight and start its clock."""
+        registry.start()
+        requests_in_flight.inc()
+        g.metrics_started_at = time.perf_counter()
+
+    def record(status, size):
+        """Record the request, if not already recorded."""
+        started_at = g.pop('metrics_started_at', None)
+        if started_at is not None:
+            rule = request.url_rule
+            observe_request(request.method,
+                            rule.rule if rule is not None else 'unmatched',
+                            status, time.perf_counter() - started_at, size)
+
+    def finish(response):
+        """Record the status and the size of the response."""
+        record(response.status_code, response.content_length)
+        return response
+
+    def teardown(_error):
+        """Record failed requests, and stop counting the request in flight."""
+        record(500, None)
+        requests_in_flight.dec()
+
+    # Start the clock before the other functions run
+    app.before_request_funcs.setdefault(None, []).insert(0, start)
+    app.after_request(finish)
+    app.teardown_request(teardown)
@@ -1,21 +1,16 @@
 """Module with main abstraction of models used by napps-server."""
 
 # System imports
-import json
 import re
-import smtplib
-from copy import deepcopy
+import uuid
 from datetime import datetime, timedelta
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from hashlib import md5
+from hashlib import md5, sha256
 from urllib.request import urlopen
 
-import bcrypt
-from docutils import core
-
 from napps_server import config
 # Local source tree imports
+from napps_server.core import (cache, codec, connection, credentials, mailer,
+                               metrics, readme, search, serialization, storage)
 from napps_server.core.exceptions import (InvalidUser, InvalidNappMetaData,
                                           NappsEntryDoesNotExists,
                                           RepositoryNotReachable)
@@ -24,6 +19,88 @@ from napps_server.core.utils import generate_hash, render_template
 db_con = config.DB_CON
 napps_api_url = config.NAPPS_API_URL
 
+#: Raw redis hashes of users, shared by all requests of this process.
+user_cache = cache.TTLCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+user_invalidator = cache.PubSubInvalidator('invalidate:user', user_cache)
+
+metrics.registry.register(metrics.Counter(
+    'napps_user_cache_hits_total', 'Users found in the in-process cache.',
+    function=lambda: user_cache.hits))
+metrics.registry.register(metrics.Counter(
+    'napps_user_cache_misses_total', 'Users not found in the cache.',
+    function=lambda: user_cache.misses))
+metrics.registry.register(metrics.Gauge(
+    'napps_user_cache_entries', 'Users in the in-process cache.',
+    function=lambda: len(user_cache)))
+
+
+def _index_page(index, prefix, cursor=None, limit=None):
+    """Method used to read a page of a lexicographically ordered index.
+
+    Members of the index are redis keys sharing the same prefix and score, so
+    ZRANGEBYLEX returns them ordered by name. Only the requested page is read.
+
+    Parameters:
+        index (string): Redis key of the sorted set.
+        prefix (string): Prefix shared by all the members (e.g. 'napp:').
+        cursor (string): Last name of the previous page, if any.
+        limit (int): Maximum number of members. None means no limit.
+
+    Returns:
+        page (tuple): List of members and the cursor of the next page, which
+                      is None if this is the last one.
+    """
+    start = '(' + prefix + cursor if cursor else '-'
+    if limit:
+        members = db_con.zrangebylex(index, start, '+', 0, limit + 1)
+    else:
+        members = db_con.zrangebylex(index, start, '+')
+
+    next_cursor = None
+    if limit and len(members) > limit:
+        members = members[:limit]
+        next_cursor = members[-1][len(prefix):]
+    return members, next_cursor
+
+
+def _index_is_stale(members, index):
+    """Method used to check if an ordered index differs from its set.
+
+    Deployments upgraded from versions without the index, or whose first
+    save after the upgrade created it, have members missing from it.
+
+    Parameters:
+        members (string): Redis key of the set of members (e.g. 'napps').
+        index (string): Redis key of the sorted set.
+
+    Returns:
+        stale (bool): True if the set and the index sizes differ.
+    """
+    pipe = db_con.pipeline(transaction=False)
+    pipe.scard(members)
+    pipe.zcard(index)
+    count, indexed = pipe.execute()
+    return count != indexed
+
+
+def _rebuild_index(members, index):
+    """Method used to replace an ordered index by the members of its set.
+
+    Parameters:
+        members (string): Redis key of the set of members (e.g. 'napps').
+        index (string): Redis key of the sorted set.
+
+    Returns:
+        members (set): Members indexed.
+    """
+    keys = db_con.smembers(members)
+    pipe = db_con.pipeline()
+    pipe.delete(index)
+    if keys:
+        pipe.zadd(index, {key: 0 for key in keys})
+    pipe.execute()
+    return keys
+
 
 class User(object):
     """Class to manage User Models."""
@@ -79,6 +156,16 @@ class User(object):
         attributes_names = set(User.schema)
         return attributes_names.difference(excludes)
 
+    @classmethod
+    def encoded_fields(cls):
+        """Method used to return the fields stored with the codec.
+
+        Returns:
+            fields (list): Fields of the redis hash of a user that are encoded
+                           by :mod:`napps_server.core.codec`.
+        """
+        return ['enabled']
+
     @property
     def avatar(self):
         email_hash = md5(self.email.encode('utf-8'))
@@ -109,7 +196,9 @@ class User(object):
             return None
 
         attributes = db_con.hgetall(key)
-        token = Token.from_dict(attributes)
+        if not attributes:
+            return None
+        token = Token.from_dict(attributes, self)
         if token.is_valid():
             return token
         else:
@@ -126,15 +215,61 @@ class User(object):
             user (:class:`napps.core.models.User`):
                 User class with the given username.
         """
-        attributes = db_con.hgetall("user:%s" % username)
+        metrics.count('User.get')
+        user_invalidator.listen()
+        attributes = user_cache.get(username)
+        if attributes is None:
+            generation = user_cache.generation
+            # Cached values outlive the request, so they are read from the
+            # primary, which has the writes that invalidated them.
+            with connection.primary_reads():
+                attributes = db_con.hgetall("user:%s" % username)
+            if attributes:
+                user_cache.set(username, attributes, generation)
+
         if attributes:
-            user = User.from_dict(attributes)
-            user.password = attributes['password'].encode('utf-8')
-            return user
+            return User._from_redis(attributes)
         else:
             msg = "User {} not found.".format(username)
             raise NappsEntryDoesNotExists(msg)
 
+    @classmethod
+    def get_many(cls, usernames):
+        """Method used to get several users in a single round trip.
+
+        Parameters:
+            usernames (iterable): Usernames of users registered.
+
+        Returns:
+            users (dict): Users found, indexed by username. Usernames not
+                          found are left out.
+        """
+        metrics.count('User.get_many')
+        user_invalidator.listen()
+        users = {}
+        missing = []
+        for username in set(usernames):
+            attributes = user_cache.get(username)
+            if attributes is None:
+                missing.append(username)
+            else:
+                users[username] = User._from_redis(attributes)
+        if not missing:
+            return users
+
+        generation = user_cache.generation
+        pipe = db_con.pipeline(transaction=False)
+        for username in missing:
+            pipe.hgetall("user:%s" % username)
+        with connection.primary_reads():
+            results = pipe.execute()
+
+        for username, attributes in zip(missing, results):
+            if attributes:
+                user_cache.set(username, attributes, generation)
+                users[username] = User._from_redis(attributes)
+        return users
+
     @classmethod
     def all(cls):
         """Method used to return all users registered.
@@ -142,8 +277,46 @@ class User(object):
         Returns:
             users (list): List of users registered.
         """
+        metrics.count('User.all')
         users = db_con.smembers("users")
-        return [User.get(re.sub(r'^user:', '', user)) for user in users]
+        usernames = [re.sub(r'^user:', '', user) for user in users]
+        return list(User.get_many(usernames).values())
+
+    @classmethod
+    def page(cls, cursor=None, limit=None):
+        """Method used to return a page of users ordered by username.
+
+        Parameters:
+            cursor (string): Last username of the previous page, if any.
+            limit (int): Maximum number of users in the page.
+
+        Returns:
+            page (tuple): List of users and the cursor of the next page, which
+                          is None if this is the last one.
+        """
+        if not cursor and _index_is_stale('users', 'users:index'):
+            cls.rebuild_index()
+        keys, next_cursor = _index_page('users:index', 'user:', cursor, limit)
+        usernames = [re.sub(r'^user:', '', key) for key in keys]
+        users = User.get_many(usernames)
+        page = [users[name] for name in usernames if name in users]
+        return page, next_cursor
+
+    @classmethod
+    def rebuild_index(cls):
+        """Method used to rebuild the ordered and autocomplete user indexes.
+
+        Returns:
+            count (int): Number of users indexed.
+        """
+        users = _rebuild_index('users', 'users:index')
+        if users:
+            pipe = db_con.pipeline(transaction=False)
+            for user in users:
+                username = re.sub(r'^user:', '', user)
+                search.add_completion('users', username, [username], pipe)
+            pipe.execute()
+        return len(users)
 
     @classmethod
     def check_auth(cls, username, password):
@@ -161,9 +334,14 @@ class User(object):
         except NappsEntryDoesNotExists:
             return False
 
-        if not bcrypt.checkpw(password.encode('utf-8'), user.password):
-            return False
-        return True
+        return credentials.check_password(username, password, user.password)
+
+    @classmethod
+    def _from_redis(cls, attributes):
+        """Method to create a user, password included, from a redis hash."""
+        user = User.from_dict(attributes)
+        user.password = attributes['password'].encode('utf-8')
+        return user
 
     @classmethod
     def from_dict(cls, attributes):
@@ -180,7 +358,7 @@ class User(object):
         for attribute in User.attributes():
             setattr(user, attribute, attributes.get(attribute, None))
 
-        user.enabled = eval(attributes.get('enabled', False))
+        user.enabled = bool(codec.decode(attributes.get('enabled'), False))
 
         return user
 
@@ -190,19 +368,25 @@ class User(object):
         Parameters:
             password (string): New password to be updated.
         """
-        password = password.encode('utf-8')
-        self.password = bcrypt.hashpw(password, bcrypt.gensalt())
+        self.password = credentials.hash_password(password)
         self.save()
 
     def disable(self):
-        """Method used to disable the user."""
+        """Method used to disable the user.
+
+        As any other save, this invalidates the user in every process cache.
+        """
         self.enabled = False
         token = self.token
-        token.invalidate()
+        if token:
+            token.invalidate()
         self.save()
 
     def enable(self):
-        """Method used to enable the user."""
+        """Method used to enable the user.
+
+        As any other save, this invalidates the user in every process cache.
+        """
         self.enabled = True
         self.save()
 
@@ -215,7 +399,8 @@ class User(object):
         Return:
             user (dict): Python dict with user informations.
         """
-        result = deepcopy(self.__dict__)
+        # Attributes are immutable values, a shallow copy is enough.
+        result = dict(self.__dict__)
         if hide_sensible:
             del result['password']
 
@@ -235,7 +420,8 @@ class User(object):
         Return:
             user (string): JSON format with user informations.
         """
-        return json.dumps(self.as_dict(hide_sensible, detailed))
+        return serialization.dumps(
+            self.as_dict(hide_sensible, detailed)).decode('utf-8')
 
     def save(self):
         """Save a object into redis database.
@@ -244,9 +430,24 @@ class User(object):
         """
         if not self.password:
             raise InvalidUser('Impossible to save a user without password.')
-        db_con.sadd("users", self.redis_key)
-        db_con.hmset(self.redis_key, self.as_dict(hide_sensible=False,
-                                                  detailed=True))
+        # The catalog embeds the avatar of the napps owners, built from their
+        # email, so it only changes when an existing user changes its email.
+        with connection.primary_reads():
+            previous_email = db_con.hget(self.redis_key, 'email')
+        fields = self.as_dict(hide_sensible=False, detailed=True)
+        fields['enabled'] = codec.encode(bool(self.enabled))
+        # The user is indexed in the same transaction, after its hash, so it
+        # is never listed if the hash can't be written.
+        pipe = db_con.pipeline()
+        pipe.hmset(self.redis_key, fields)
+        pipe.sadd("users", self.redis_key)
+        pipe.zadd('users:index', {self.redis_key: 0})
+        search.add_completion('users', self.username, [self.username],
+                              pipe=pipe)
+        pipe.execute()
+        user_invalidator.publish(self.username)
+        if previous_email is not None and previous_email != self.email:
+            Catalog.bump_version()
 
     def delete(self):
         """Delete a object into redis databse.
@@ -257,10 +458,15 @@ class User(object):
             msg = 'Impossible to delete a user without password.'
             raise InvalidUser(msg)
         [napp.delete() for napp in self.get_all_napps()]
-        if db_con.delete(self.redis_key) == 0 or \
-           db_con.srem('users', self.redis_key) == 0:
-            return False
-        return True
+        db_con.zrem('users:index', self.redis_key)
+        search.remove_completion('users', self.username, [self.username])
+        try:
+            if db_con.delete(self.redis_key) == 0 or \
+               db_con.srem('users', self.redis_key) == 0:
+                return False
+            return True
+        finally:
+            user_invalidator.publish(self.username)
 
     def create_token(self, expiration_time=86400):
         """Method used to create a valid token.
@@ -273,27 +479,20 @@ class User(object):
         """
         token = Token(user=self, expiration_time=expiration_time)
         token.save()
-        db_con.lpush("%s:tokens" % self.redis_key, token.redis_key)
+        pipe = db_con.pipeline(transaction=False)
+        pipe.lpush("%s:tokens" % self.redis_key, token.redis_key)
+        # Only the latest token is used, older ones expire by themselves.
+        pipe.ltrim("%s:tokens" % self.redis_key, 0, 9)
+        pipe.execute()
         return token
 
     def send_email(self, template, subject):
-        """Method used to send a email."""
-        message = MIMEMultipart('alternative')
-        message['Subject'] = subject
-        message['From'] = 'no-reply@kytos.io'
-        message['To'] = self.email
-        part1 = MIMEText(template, 'html')
-        message.attach(part1)
-        try:
-            smtp = smtplib.SMTP('localhost')
-            smtp.sendmail('no-reply@kytos.io', self.email, message.as_string())
-            smtp.quit()
-        except smtplib.SMTPRecipientsRefused:
-            return '', 500
-        except ConnectionRefusedError:
-            msg = 'Ops, some error occurred while trying to send an email to '
-            msg += '{}, please contact the admin team at contact@kytos.io.'
-            return msg.format(self.email), 500
+        """Method used to send a email.
+
+        The email is pushed to the outbox and sent later by the mail worker
+        (see :mod:`napps_server.core.mailer`).
+        """
+        mailer.enqueue(self.email, subject, template)
 
     def send_token(self):
         """Method used to send a message with a valid token to a user."""
@@ -323,7 +522,7 @@ class User(object):
             napps (list): list of Napps from this user.
         """
         napps = db_con.smembers("{}:napps".format(self.redis_key))
-        return [Napp(db_con.hgetall(napp), self.username) for napp in napps]
+        return Napp.get_many(napps, {self.username: self})
 
     def get_napp_by_name(self, name):
         """Method used to return Napp with specific name.
@@ -335,13 +534,12 @@ class User(object):
             napp (:class:`napps_server.core.models.NApp`):
                 Napp found with the given name.
         """
-        try:
-            napp = Napp(db_con.hgetall("napp:{}/{}".format(self.username,
-                                                           name)))
-            return napp
-        except:
+        key = "napp:{}/{}".format(self.username, name)
+        napps = Napp.get_many([key], {self.username: self})
+        if not napps:
             msg = "Napp {} not found for user {}.".format(name, self.username)
             raise NappsEntryDoesNotExists(msg)
+        return napps[0]
 
 
 class Token(object):
@@ -357,12 +555,13 @@ class Token(object):
             created_at (datetime): Datetime to register when this token was
                                    created.
             user (:class:`napps_server.core.models.User`):
-                User that this token belong.
+                User that this token belong. A username is also accepted, in
+                which case the user is only loaded when first used.
             expiration_time (int): integer to represent token lifetime.
         """
         self.hash = hash_value if hash_value else generate_hash()
         self.created_at = created_at if created_at else datetime.utcnow()
-        self.user = user
+        self.user = LazyUser(user) if isinstance(user, str) else user
         self.expiration_time = expiration_time
 
     @property
@@ -384,11 +583,14 @@ class Token(object):
         return self.created_at + timedelta(seconds=self.expiration_time)
 
     @classmethod
-    def from_dict(cls, attributes):
+    def from_dict(cls, attributes, user=None):
         """Method used to create a Token based on dict with Token attributes.
 
         Parameters:
             attributes (dict): Python dictionary with Token attributes.
+            user (:class:`napps_server.core.models.User`):
+                Owner of the token, if already loaded. Otherwise, the owner is
+                only loaded when first used.
 
         Returns:
             token (:class:`napps_server.core.models.Token`):
@@ -398,7 +600,7 @@ class Token(object):
         return Token(attributes['hash'],
                      datetime.strptime(attributes['created_at'],
                                        '%Y-%m-%d %H:%M:%S.%f'),
-                     User.get(attributes['user']),
+                     user or attributes['user'],
                      int(attributes['expiration_time']))
 
     @classmethod
@@ -417,6 +619,98 @@ class Token(object):
         else:
             raise NappsEntryDoesNotExists("Token not found.")
 
+    @classmethod
+    def owner(cls, token):
+        """Method used to validate a token hash in a single round trip.
+
+        Tokens are stored with a redis expiration, so a token exists only
+        while it is valid. Tokens saved by older versions have no expiration
+        until :meth:`expire_legacy_tokens` runs, so their validity is checked
+        from their attributes.
+
+        Parameters:
+            token (string): Token hash.
+        Returns:
+            user (:class:`napps_server.core.models.LazyUser`):
+                Owner of the token, loaded only when first used.
+        Raises:
+            NappsEntryDoesNotExists: If the token is invalid or expired.
+        """
+        metrics.count('Token.owner')
+        pipe = db_con.pipeline(transaction=False)
+        pipe.hmget("token:%s" % token, 'user', 'created_at',
+                   'expiration_time')
+        pipe.ttl("token:%s" % token)
+        (username, created_at, expiration_time), ttl = pipe.execute()
+        if not username or (ttl == -1 and not Token.is_legacy_valid(
+                created_at, expiration_time)):
+            raise NappsEntryDoesNotExists("Token not found.")
+        return LazyUser(username)
+
+    @staticmethod
+    def is_legacy_valid(created_at, expiration_time):
+        """Method used to validate a token stored without redis expiration.
+
+        Parameters:
+            created_at (string): Creation date of the token.
+            expiration_time (string): Seconds the token is valid for.
+        Returns:
+            is_valid (bool): True if the token is valid yet, otherwise False.
+        """
+        try:
+            created_at = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S.%f')
+            expires_at = created_at + timedelta(seconds=int(expiration_time))
+        except (TypeError, ValueError):
+            return False
+        return datetime.utcnow() <= expires_at
+
+    @classmethod
+    def expire_legacy_tokens(cls, batch_size=1000):
+        """Method used to set the redis expiration of tokens stored without it.
+
+        Tokens saved by older versions never expire in redis. This method sets
+        their expiration based on their attributes, deleting the ones already
+        expired.
+
+        Parameters:
+            batch_size (int): Number of keys handled per round trip.
+
+        Returns:
+            count (int): Number of tokens updated or deleted.
+        """
+        count = 0
+        keys = db_con.scan_iter(match='token:*', count=batch_size)
+        while True:
+            batch = [key for _, key in zip(range(batch_size), keys)]
+            if not batch:
+                return count
+
+            pipe = db_con.pipeline(transaction=False)
+            for key in batch:
+                pipe.ttl(key)
+            legacy = [key for key, ttl in zip(batch, pipe.execute())
+                      if ttl == -1]
+
+            pipe = db_con.pipeline(transaction=False)
+            for key in legacy:
+                pipe.hgetall(key)
+            tokens = pipe.execute()
+
+            pipe = db_con.pipeline(transaction=False)
+            for key, attributes in zip(legacy, tokens):
+                try:
+                    token = Token.from_dict(attributes)
+                except (KeyError, ValueError):
+                    pipe.delete(key)
+                    continue
+                remaining = token.expires_at - datetime.utcnow()
+                if remaining.total_seconds() < 1:
+                    pipe.delete(key)
+                else:
+                    pipe.expire(key, int(remaining.total_seconds()))
+            pipe.execute()
+            count += len(legacy)
+
     def is_valid(self):
         """Method to validate if the token instance is valid.
 
@@ -428,7 +722,8 @@ class Token(object):
     def invalidate(self):
         """Method used to invalidate a token instance.
 
-        This method will attribute 0 to the expiration_time attribute.
+        This method will attribute 0 to the expiration_time attribute and
+        delete the token from redis.
         """
         self.expiration_time = 0
         self.save()
@@ -439,9 +734,22 @@ class Token(object):
         Returns:
             token (dict): Dict built from this Token attributes.
         """
-        token = deepcopy(self.__dict__)
-        token['user'] = self.user.username
-        return token
+        return {'hash': self.hash,
+                'created_at': self.created_at,
+                'user': self.user.username,
+                'expiration_time': self.expiration_time}
+
+    def redis_fields(self):
+        """Method used to build the redis hash of the token.
+
+        The creation date is stored in the format read by :meth:`from_dict`.
+
+        Returns:
+            fields (dict): Fields of the redis hash of the token.
+        """
+        fields = self.as_dict()
+        fields['created_at'] = self.created_at.strftime('%Y-%m-%d %H:%M:%S.%f')
+        return fields
 
     def as_json(self):
         """Method used to create a JSON string based on current token instance.
@@ -450,7 +758,7 @@ class Token(object):
             json (string): JSON with attributes of current token instance.
         """
         token_dict = self.as_dict()
-        return json.dumps(token_dict)
+        return serialization.dumps(token_dict).decode('utf-8')
 
     def assign_to_user(self, user):
         """Method used to change the token user.
@@ -464,10 +772,51 @@ class Token(object):
     def save(self):
         """Save a object into redis database.
 
-        This is a save/update method. If the token exists then update.
+        This is a save/update method. If the token exists then update. The
+        token expires in redis at the same time it becomes invalid, so tokens
+        never need to be cleaned up.
         """
-        db_con.sadd("tokens", self.redis_key)
-        db_con.hmset(self.redis_key, self.as_dict())
+        ttl = int((self.expires_at - datetime.utcnow()).total_seconds())
+        pipe = db_con.pipeline(transaction=False)
+        if ttl > 0:
+            pipe.hmset(self.redis_key, self.redis_fields())
+            pipe.expire(self.redis_key, ttl)
+        else:
+            pipe.delete(self.redis_key)
+            pipe.lrem("user:%s:tokens" % self.user.username, 0,
+                      self.redis_key)
+        pipe.execute()
+
+
+class LazyUser(object):
+    """Proxy to a User that is only loaded from redis when first used."""
+
+    def __init__(self, username):
+        """Constructor of LazyUser class.
+
+        Parameters:
+            username (string): Username of a valid user registered.
+        """
+        self.username = username
+        self.missing = False
+        self._user = None
+
+    def __getattr__(self, name):
+        """Load the user on the first access to any other attribute.
+
+        Raises:
+            NappsEntryDoesNotExists: If the user was deleted. The missing
+                attribute is then set.
+        """
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._user is None:
+            try:
+                self._user = User.get(self.username)
+            except NappsEntryDoesNotExists:
+                self.missing = True
+                raise
+        return getattr(self._user, name)
 
 
 class Napp(object):
@@ -508,8 +857,12 @@ class Napp(object):
         # be removed.
         username = content.get('username', content.get('author'))
 
-        self.user = User.get(username)
+        if user is not None and user.username == username:
+            self.user = user
+        else:
+            self.user = User.get(username)
         self.readme = ""
+        self._readme_html = None
         if content is not None:
             self._populate_from_dict(content)
 
@@ -522,6 +875,27 @@ class Napp(object):
         """
         return "napp:{}/{}".format(self.username, self.name)
 
+    @property
+    def identifier(self):
+        """Method used to return the '<username>/<name>' of this Napp.
+
+        Returns:
+            identifier (string): Username and name of this Napp.
+        """
+        return "{}/{}".format(self.username, self.name)
+
+    @staticmethod
+    def completion_terms(identifier):
+        """Method used to return the terms that autocomplete to a napp.
+
+        Parameters:
+            identifier (string): '<username>/<name>' of the napp.
+
+        Returns:
+            terms (list): The identifier itself and the napp name.
+        """
+        return [identifier, identifier.split('/', 1)[-1]]
+
     @property
     def readme_rst(self):
         """Method used to return a readme string from this Napp instance.
@@ -535,11 +909,16 @@ class Napp(object):
     def readme_html(self):
         """Method used to build a html based on readme of the current instance.
 
+        The html is rendered once per README change and read from the cache
+        stored next to this Napp afterwards.
+
         Returns:
             readme_html (string): Text with html based on readme.
         """
-        parts = core.publish_parts(source=self.readme_rst, writer_name='html')
-        return parts['body_pre_docinfo'] + parts['fragment']
+        if self._readme_html is None:
+            self._readme_html = readme.get_html(self.redis_key,
+                                                self.readme_rst)
+        return self._readme_html
 
     @classmethod
     def all(cls):
@@ -548,8 +927,81 @@ class Napp(object):
         Returns:
             napps (list): List with all napps registered.
         """
-        napps = db_con.smembers("napps")
-        return [Napp(db_con.hgetall(napp)) for napp in napps]
+        metrics.count('Napp.all')
+        return cls.get_many(db_con.smembers("napps"))
+
+    @classmethod
+    def page(cls, cursor=None, limit=None):
+        """Method used to return a page of napps ordered by name.
+
+        Parameters:
+            cursor (string): Last '<username>/<name>' of the previous page.
+            limit (int): Maximum number of napps in the page.
+
+        Returns:
+            page (tuple): List of napps and the cursor of the next page, which
+                          is None if this is the last one.
+        """
+        if not cursor and _index_is_stale('napps', 'napps:index'):
+            cls.rebuild_index()
+        keys, next_cursor = _index_page('napps:index', 'napp:', cursor, limit)
+        return cls.get_many(keys), next_cursor
+
+    @classmethod
+    def rebuild_index(cls):
+        """Method used to rebuild the ordered and autocomplete napp indexes.
+
+        Returns:
+            count (int): Number of napps indexed.
+        """
+        napps = _rebuild_index('napps', 'napps:index')
+        if napps:
+            pipe = db_con.pipeline(transaction=False)
+            for napp in napps:
+                identifier = re.sub(r'^napp:', '', napp)
+                search.add_completion('napps', identifier,
+                                      Napp.completion_terms(identifier), pipe)
+            pipe.execute()
+        return len(napps)
+
+    @classmethod
+    def get_many(cls, keys, users=None):
+        """Method used to load several napps in a fixed number of round trips.
+
+        The napps hashes and their cached READMEs are fetched in one pipeline
+        and their distinct owners in another one.
+
+        Parameters:
+            keys (iterable): Redis keys of the napps (napp:<username>/<name>).
+            users (dict): Owners already loaded, indexed by username.
+
+        Returns:
+            napps (list): Napps found. Keys not found or whose owner does not
+                          exist anymore are left out.
+        """
+        metrics.count('Napp.get_many')
+        keys = list(keys)
+        pipe = db_con.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+            pipe.hgetall(readme.readme_key(key))
+        results = pipe.execute()
+        contents, readmes = results[0::2], results[1::2]
+
+        users = dict(users or {})
+        usernames = {content.get('username', content.get('author'))
+                     for content in contents if content}
+        users.update(User.get_many(usernames.difference(users)))
+
+        napps = []
+        for key, content, cached in zip(keys, contents, readmes):
+            username = content.get('username', content.get('author'))
+            if not content or username not in users:
+                continue
+            napp = cls(content, users[username])
+            napp._readme_html = readme.get_html(key, napp.readme_rst, cached)
+            napps.append(napp)
+        return napps
 
     def _populate_from_dict(self, attributes):
         """Method used to populate a Napp instance based on python dict.
@@ -567,31 +1019,85 @@ class Napp(object):
                 # Converting to list, if needed.
                 if self.schema[key]['type'] == 'array' and \
                    not isinstance(attributes.get(key), list):
-                    attributes[key] = eval(attributes.get(key, []))
+                    attributes[key] = codec.decode(attributes.get(key), [])
 
                 setattr(self, key, attributes.get(key))
 
         self.readme = self.readme or self.long_description or self.description
 
     @classmethod
-    def new_napp_from_dict(cls, attributes, user):
+    def encoded_fields(cls):
+        """Method used to return the fields stored with the codec.
+
+        Returns:
+            fields (list): Fields of the redis hash of a napp that are encoded
+                           by :mod:`napps_server.core.codec`.
+        """
+        return [key for key in cls.schema
+                if key != 'required' and cls.schema[key]['type'] == 'array']
+
+    @classmethod
+    def redis_fields(cls, attributes):
+        """Method used to build the redis hash of a napp from its attributes.
+
+        Parameters:
+            attributes (dict): Napp attributes, e.g. from kytos.json.
+
+        Returns:
+            fields (dict): Fields of the redis hash of the napp.
+        """
+        fields = {}
+        for key in cls.schema:
+            if key in ('required', 'user'):
+                continue
+            value = attributes.get(key)
+            if cls.schema[key]['type'] == 'array':
+                fields[key] = codec.encode(list(value or []))
+            else:
+                fields[key] = value if value is not None else ''
+
+        fields['readme'] = attributes.get('readme') or \
+            attributes.get('long_description') or \
+            attributes.get('description') or ''
+        fields['user'] = attributes['username']
+        # WARNING: This will be removed in future versions, when 'author' will
+        # be removed.
+        fields['author'] = attributes['username']
+        return fields
+
+    @classmethod
+    def new_napp_from_dict(cls, attributes, user, incoming=None):
         """Method used to register a new Napp from dict.
 
+        The .napp file is stored before the napp is saved, so a napp is never
+        listed nor searchable without its version. The version is dropped if
+        the napp cannot be saved.
+
         Parameters:
             attributes (dict):
                 Python dictionary with napp attributes.
             user (:class:`napps_server.core.models.User`):
                 User that belongs the new napp instance.
+            incoming (:class:`napps_server.core.uploads.IncomingFile`):
+                Uploaded .napp file, stored as the latest version, if any.
         Returns:
             napp (:class:`napps_server.core.models.Napp`):
                 The new Napp instance registered.
         """
         napp = cls(attributes, user)
-        if napp.user.username != napp.username:
+        if user.username != napp.username:
             raise InvalidUser
-        else:
+
+        version = None
+        if incoming is not None:
+            version = storage.add_version(napp.username, napp.name, incoming)
+        try:
             napp.save()
-            return napp
+        except Exception:
+            if version is not None:
+                storage.remove_version(napp.username, napp.name, version)
+            raise
+        return napp
 
     def update_from_dict(self, attributes):
         """Method used to update the Napp instance with dict attributes.
@@ -625,8 +1131,7 @@ class Napp(object):
         data['readme'] = self.readme_html
 
         # Add User avatar link
-        user = User.get(self.username)
-        data['avatar'] = user.avatar
+        data['avatar'] = self.user.avatar
         return data
 
     def as_json(self):
@@ -636,18 +1141,30 @@ class Napp(object):
             json (string): JSON string with attributes from current instance.
         """
         data = self.as_dict()
-        return json.dumps(data)
+        return serialization.dumps(data).decode('utf-8')
 
     def save(self):
         """Save a object into redis database.
 
         This is a save/update method. If the app exists then update.
         """
-        db_con.sadd("napps", self.redis_key)
-        db_con.sadd("user:%s:napps" % self.username, self.redis_key)
+        # Render the README only if it changed since the last save.
+        self._readme_html = None
         data = self.as_dict()
         data['readme'] = self.readme_rst
-        db_con.hmset(self.redis_key, data)
+        # The napp is indexed in the same transaction, after its hash, so it
+        # is never listed nor searchable if the hash can't be written.
+        pipe = db_con.pipeline()
+        pipe.hmset(self.redis_key, self.redis_fields(data))
+        pipe.sadd("napps", self.redis_key)
+        pipe.zadd('napps:index', {self.redis_key: 0})
+        search.add_completion('napps', self.identifier,
+                              self.completion_terms(self.identifier),
+                              pipe=pipe)
+        pipe.sadd("user:%s:napps" % self.username, self.redis_key)
+        search.index(self.redis_key, data, pipe=pipe)
+        pipe.execute()
+        Catalog.bump_version()
 
     def delete(self):
         """Delete a object from redis database."""
@@ -655,8 +1172,127 @@ class Napp(object):
             msg = 'Impossible to delete a napp without password.'
             raise InvalidUser(msg)
 
-        if db_con.delete(self.redis_key) == 0 or \
-           db_con.srem('napps', self.redis_key) == 0 or \
-           db_con.srem('{}:napps'.format(self.user.redis_key), self.redis_key):
-            return False
-        return True
+        readme.delete(self.redis_key)
+        storage.remove_napp(self.username, self.name)
+        search.unindex(self.redis_key)
+        search.remove_completion('napps', self.identifier,
+                                 self.completion_terms(self.identifier))
+        db_con.zrem('napps:index', self.redis_key)
+        try:
+            if db_con.delete(self.redis_key) == 0 or \
+               db_con.srem('napps', self.redis_key) == 0 or \
+               db_con.srem('{}:napps'.format(self.user.redis_key),
+                           self.redis_key):
+                return False
+            return True
+        finally:
+            Catalog.bump_version()
+
+
+class Catalog(object):
+    """Class to manage the materialized catalog of napps.
+
+    The catalog is the JSON document served by GET /napps/. It is serialized
+    once per change and stored in redis with the catalog version it was built
+    from. Every mutation of napps (or of their owners) bumps that version, so
+    the next reader finds the stored snapshot stale and builds a new one.
+    Only one reader builds it at a time, the others keep serving the previous
+    snapshot meanwhile.
+    """
+
+    version_key = 'catalog:version'
+    snapshot_key = 'catalog:snapshot'
+    lock_key = 'catalog:lock'
+
+    @classmethod
+    def bump_version(cls):
+        """Method used to invalidate the current catalog snapshot.
+
+        It must be called after the mutation has been written, so a snapshot
+        built from the new version always contains it.
+
+        Returns:
+            version (int): The new catalog version.
+        """
+        return db_con.incr(cls.version_key)
+
+    @classmethod
+    def build(cls, version):
+        """Method used to serialize and store a new catalog snapshot.
+
+        Parameters:
+            version (string): Catalog version read before loading the napps.
+
+        Returns:
+            snapshot (tuple): The ETag and the JSON body of the snapshot.
+        """
+        metrics.count('Catalog.build')
+        # The snapshot is stored with the given version, so the napps must be
+        # read from the primary, as the version was.
+        with connection.primary_reads():
+            napps = [napp.as_dict() for napp in Napp.all()]
+        body = serialization.dumps({'napps': napps})
+        etag = sha256(body).hexdigest()
+        db_con.hmset(cls.snapshot_key, {'version': version, 'etag': etag,
+                                        'body': body})
+        return etag, body
+
+    @classmethod
+    def rebuild(cls, version):
+        """Method used to build a new snapshot, unless another process is.
+
+        The build is guarded by a lock that expires after
+        CATALOG_BUILD_TIMEOUT seconds, in case its owner dies.
+
+        Parameters:
+            version (string): Catalog version read before loading the napps.
+
+        Returns:
+            snapshot (tuple): The ETag and the JSON body of the new snapshot,
+                              or None if another process is building it.
+        """
+        owner = uuid.uuid4().hex
+        if not db_con.set(cls.lock_key, owner, nx=True,
+                          ex=config.CATALOG_BUILD_TIMEOUT):
+            return None
+        try:
+            return cls.build(version)
+        finally:
+            with connection.primary_reads():
+                if db_con.get(cls.lock_key) == owner:
+                    db_con.delete(cls.lock_key)
+
+    @classmethod
+    def get(cls, etag=None):
+        """Method used to get the current catalog snapshot.
+
+        Parameters:
+            etag (string): ETag already known by the client, if any.
+
+        Returns:
+            snapshot (tuple): The ETag and the JSON body of the snapshot. The
+                              body is None if the given etag is still current.
+        """
+        # A replica may not have the latest version yet, and would serve the
+        # previous snapshot as if it was current.
+        with connection.primary_reads():
+            pipe = db_con.pipeline(transaction=False)
+            pipe.get(cls.version_key)
+            pipe.hmget(cls.snapshot_key, 'version', 'etag')
+            version, (snapshot_version, snapshot_etag) = pipe.execute()
+        version = version or '0'
+
+        if snapshot_version != version:
+            snapshot = cls.rebuild(version)
+            if snapshot is not None:
+                return snapshot
+        if etag is not None and etag == snapshot_etag:
+            return snapshot_etag, None
+
+        with connection.primary_reads():
+            snapshot_etag, body = db_con.hmget(cls.snapshot_key, 'etag',
+                                               'body')
+        if body is None:
+            # There is no previous snapshot to serve.
+            return cls.build(version)
+        return snapshot_etag, body
@@ -0,0 +1,151 @@
+"""Module used to render and cache the README of napps.
+
+The reStructuredText of a NApp README is rendered only when its content
+changes. The rendered html is stored next to the NApp, in the redis hash
+``napp:<username>/<name>:readme``, together with the hash of the content that
+produced it. Readers compare that hash with the hash of the current README to
+detect stale entries.
+"""
+import argparse
+import hashlib
+import sys
+
+import docutils
+from docutils import core
+
+from napps_server import config
+from napps_server.core import metrics
+
+db_con = config.DB_CON
+
+
+def readme_key(napp_key):
+    """Method used to build the redis key of a rendered README.
+
+    Parameters:
+        napp_key (string): Redis key of the napp (napp:<username>/<name>).
+
+    Returns:
+        key (string): String with redis key.
+    """
+    return "{}:readme".format(napp_key)
+
+
+def readme_hash(source):
+    """Method used to hash a README source.
+
+    The docutils version is part of the hash, so entries rendered by an older
+    docutils are detected as stale.
+
+    Parameters:
+        source (string): reStructuredText of the README.
+
+    Returns:
+        hash (string): Hexadecimal sha256 of the source.
+    """
+    content = '{}\0{}'.format(docutils.__version__, source or '')
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def render(source):
+    """Method used to build a html based on a reStructuredText.
+
+    Parameters:
+        source (string): reStructuredText of the README.
+
+    Returns:
+        readme_html (string): Text with html based on readme.
+    """
+    metrics.count('readme.render')
+    parts = core.publish_parts(source=source or '', writer_name='html')
+    return parts['body_pre_docinfo'] + parts['fragment']
+
+
+def store(napp_key, source, digest=None):
+    """Method used to render a README and store the html into redis.
+
+    Parameters:
+        napp_key (string): Redis key of the napp.
+        source (string): reStructuredText of the README.
+        digest (string): Hash of the source, computed if not given.
+
+    Returns:
+        readme_html (string): The rendered html.
+    """
+    digest = digest or readme_hash(source)
+    html = render(source)
+    db_con.hmset(readme_key(napp_key), {'hash': digest, 'html': html})
+    return html
+
+
+def get_html(napp_key, source, cached=None):
+    """Method used to get the rendered html of a README.
+
+    The html is rendered and stored again only if the cached entry is missing
+    or stale.
+
+    Parameters:
+        napp_key (string): Redis key of the napp.
+        source (string): reStructuredText of the README.
+        cached (dict): Cached entry already fetched from redis, if any.
+
+    Returns:
+        readme_html (string): The rendered html.
+    """
+    if cached is None:
+        cached = db_con.hgetall(readme_key(napp_key))
+    digest = readme_hash(source)
+    if cached and cached.get('hash') == digest:
+        return cached['html']
+    return store(napp_key, source, digest)
+
+
+def delete(napp_key):
+    """Method used to delete the rendered README of a napp.
+
+    Parameters:
+        napp_key (string): Redis key of the napp.
+    """
+    db_con.delete(readme_key(napp_key))
+
+
+def render_all(force=True):
+    """Method used to render the README of every napp registered.
+
+    Parameters:
+        force (bool): Render even if the cached entry is up to date.
+
+    Returns:
+        rendered (int): Number of READMEs rendered.
+    """
+    rendered = 0
+    for napp_key in db_con.smembers('napps'):
+        attributes = db_con.hgetall(napp_key)
+        if not attributes:
+            continue
+        source = attributes.get('readme') or \
+            attributes.get('long_description') or \
+            attributes.get('description')
+        digest = readme_hash(source)
+        if not force and \
+           db_con.hget(readme_key(napp_key), 'hash') == digest:
+            continue
+        store(napp_key, source, digest)
+        rendered += 1
+    return rendered
+
+
+def main(argv=None):
+    """Re-render the README of every napp, e.g. after a docutils upgrade."""
+    parser = argparse.ArgumentParser(
+        description='Render and cache the README of every napp.')
+    parser.add_argument('--stale-only', action='store_true',
+                        help='only render missing or stale READMEs')
+    args = parser.parse_args(argv)
+    rendered = render_all(force=not args.stale_only)
+    print('{} README(s) rendered.'.format(rendered))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
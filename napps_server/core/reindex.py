@@ -0,0 +1,311 @@
+"""Module used to rebuild redis from the .napp files of the repository.
+
+Every archive of the repository, NAPP_REPO by default (blobs and files of
+older versions alike), is read in parallel, the redis state of each napp is
+computed from the kytos.json of its archives and then written with large
+pipelines: the napps set and ordered index, the napps of each user, the napp
+hashes, the versions index, the blobs references, the search and autocomplete
+indexes. The references of blobs no longer used are dropped, so
+``napps-server gc`` removes them.
+
+Users cannot be rebuilt, since the archives hold no credentials: napps whose
+owner is not registered stay hidden until the owner registers again. The
+ordered and autocomplete indexes of the registered users are rebuilt.
+"""
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from napps_server import config
+from napps_server.core import archive, search, storage
+from napps_server.core.exceptions import InvalidNappMetaData
+from napps_server.core.models import Catalog, Napp, User
+
+db_con = config.DB_CON
+
+#: Filenames of versions uploaded before the content-addressed storage.
+LEGACY_RE = re.compile(r'^.+-\d{8}-\d+\.napp$')
+
+
+def _sha256(path):
+    """Compute the SHA-256 of a file, reading it in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as napp:
+        for chunk in iter(lambda: napp.read(config.UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _scan(repo):
+    """List the archives of the repository.
+
+    Returns:
+        archives (list): Path of each archive and its digest if it is a blob
+                         (None for files of older versions).
+    """
+    blobs = storage.blobs_dir(repo)
+    found = []
+    for root, dirs, files in os.walk(repo):
+        dirs[:] = [name for name in dirs if name != '.incoming']
+        is_blob = root.startswith(blobs)
+        for filename in files:
+            path = os.path.join(root, filename)
+            # '-latest' symbolic links point to versions already listed.
+            if not filename.endswith('.napp') or os.path.islink(path):
+                continue
+            found.append((path, filename[:-len('.napp')] if is_blob else None))
+    return found
+
+
+def _read(job):
+    """Read the metadata, digest, size and mtime of an archive."""
+    path, digest = job
+    try:
+        stat = os.stat(path)
+        metadata = archive.read_metadata_from_path(path)
+        digest = digest or _sha256(path)
+    except (InvalidNappMetaData, OSError) as error:
+        return {'path': path, 'error': str(error)}
+    return {'path': path, 'digest': digest, 'size': stat.st_size,
+            'mtime': stat.st_mtime, 'metadata': metadata, 'error': None}
+
+
+def scan_repository(repo=None, jobs=None):
+    """Method used to read every archive of the repository in parallel.
+
+    Parameters:
+        repo (string): Repository path. Defaults to NAPP_REPO.
+        jobs (int): Number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        result (tuple): Archives read and archives that could not be read.
+    """
+    jobs_list = _scan(repo or config.NAPP_REPO)
+    archives, errors = [], []
+    with ProcessPoolExecutor(jobs) as pool:
+        for result in pool.map(_read, jobs_list, chunksize=8):
+            (errors if result['error'] else archives).append(result)
+    return archives, errors
+
+
+def plan(archives):
+    """Method used to compute the redis state of each napp.
+
+    Versions are the distinct archives of a napp, ordered by mtime. The
+    latest one provides the napp metadata.
+
+    Parameters:
+        archives (list): Archives returned by :func:`scan_repository`.
+
+    Returns:
+        napps (dict): Username, name, redis hash fields and versions of each
+                      napp, indexed by napp redis key.
+    """
+    grouped = defaultdict(dict)
+    for item in sorted(archives, key=lambda item: item['mtime']):
+        metadata = item['metadata']
+        if not metadata.get('username') or not metadata.get('name'):
+            continue
+        # The same content uploaded again is a single version.
+        grouped[(metadata['username'], metadata['name'])].setdefault(
+            item['digest'], item)
+
+    napps = {}
+    for (username, name), items in grouped.items():
+        versions = []
+        for sequence, item in enumerate(items.values(), 1):
+            uploaded_at = datetime.utcfromtimestamp(item['mtime'])
+            filename = os.path.basename(item['path'])
+            if not LEGACY_RE.match(filename):
+                filename = storage.versioned_name(
+                    name, sequence, uploaded_at.strftime('%Y%m%d'))
+            versions.append({'filename': filename,
+                             'sequence': sequence,
+                             'digest': item['digest'],
+                             'size': item['size'],
+                             'uploaded_at': uploaded_at.isoformat() + 'Z',
+                             'path': item['path']})
+
+        latest = list(items.values())[-1]['metadata']
+        key = "napp:{}/{}".format(username, name)
+        napps[key] = {'username': username, 'name': name,
+                      'attributes': latest,
+                      'fields': Napp.redis_fields(latest),
+                      'versions': versions}
+    return napps
+
+
+def diff(napps, batch_size=1000):
+    """Method used to compare the computed state with the one in redis.
+
+    Parameters:
+        napps (dict): State returned by :func:`plan`.
+        batch_size (int): Number of napps read per round trip.
+
+    Returns:
+        changes (list): One line per napp added ('+'), changed ('~') or
+                        missing from the repository ('-').
+    """
+    changes = []
+    keys = sorted(napps)
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        pipe = db_con.pipeline(transaction=False)
+        for key in batch:
+            napp = napps[key]
+            pipe.hgetall(key)
+            pipe.zcard(storage.versions_key(napp['username'], napp['name']))
+        results = pipe.execute()
+        for key, current, versions in zip(batch, results[0::2],
+                                          results[1::2]):
+            napp = napps[key]
+            if not current:
+                changes.append('+ {} ({} versions)'.format(
+                    key, len(napp['versions'])))
+                continue
+            fields = sorted(field for field, value in napp['fields'].items()
+                            if current.get(field) != str(value))
+            if versions != len(napp['versions']):
+                fields.append('versions: {} -> {}'.format(
+                    versions, len(napp['versions'])))
+            if fields:
+                changes.append('~ {} ({})'.format(key, ', '.join(fields)))
+
+    for key in sorted(db_con.smembers('napps').difference(napps)):
+        changes.append('- {} (not found in the repository)'.format(key))
+    return changes
+
+
+def _import_blob(version, repo=None):
+    """Make a file of an older version available as a blob of the repo."""
+    path = storage.blob_path(version['digest'], repo)
+    if version['path'] == path or os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.link(version['path'], path)
+    except OSError:
+        shutil.copy2(version['path'], path)
+
+
+def load(napps, batch_size=1000, repo=None):
+    """Method used to write the computed state into redis.
+
+    Parameters:
+        napps (dict): State returned by :func:`plan`.
+        batch_size (int): Number of napps written per pipeline.
+        repo (string): Repository path. Defaults to NAPP_REPO.
+    """
+    refs = defaultdict(int)
+    for napp in napps.values():
+        for version in napp['versions']:
+            _import_blob(version, repo)
+            refs[version['digest']] += 1
+
+    keys = sorted(napps)
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+
+        # Current search terms and versions, to drop the stale ones.
+        pipe = db_con.pipeline(transaction=False)
+        for key in batch:
+            napp = napps[key]
+            pipe.smembers(search.terms_key(key))
+            pipe.zrange(storage.versions_key(napp['username'], napp['name']),
+                        0, -1)
+        results = pipe.execute()
+
+        pipe = db_con.pipeline(transaction=False)
+        for key, old_terms, old_versions in zip(batch, results[0::2],
+                                                results[1::2]):
+            _queue_napp(pipe, key, napps[key], old_terms, old_versions)
+        pipe.execute()
+
+    # References counted before are replaced, and the blobs no longer
+    # referenced are left to the garbage collection.
+    prefix, suffix = storage.refs_key('*').split('*')
+    pipe = db_con.pipeline(transaction=False)
+    for key in db_con.scan_iter(match=storage.refs_key('*'),
+                                count=batch_size):
+        digest = key[len(prefix):-len(suffix)]
+        if digest not in refs:
+            pipe.delete(key)
+            pipe.sadd(storage.GARBAGE_KEY, digest)
+    for digest, count in refs.items():
+        pipe.set(storage.refs_key(digest), count)
+    pipe.execute()
+    User.rebuild_index()
+    Catalog.bump_version()
+
+
+def _queue_napp(pipe, key, napp, old_terms, old_versions):
+    """Queue every redis write of a napp."""
+    username, name = napp['username'], napp['name']
+    identifier = "{}/{}".format(username, name)
+    pipe.sadd('napps', key)
+    pipe.zadd('napps:index', {key: 0})
+    pipe.sadd("user:%s:napps" % username, key)
+    pipe.hmset(key, napp['fields'])
+    search.add_completion('napps', identifier,
+                          Napp.completion_terms(identifier), pipe)
+    search.index(key, napp['attributes'], pipe, old_terms)
+
+    for filename in old_versions:
+        pipe.delete(storage.version_key(username, name, filename))
+    pipe.delete(storage.versions_key(username, name))
+    for version in napp['versions']:
+        fields = dict(version)
+        fields.pop('path')
+        pipe.hmset(storage.version_key(username, name, fields['filename']),
+                   fields)
+        pipe.zadd(storage.versions_key(username, name),
+                  {fields['filename']: fields['sequence']})
+    pipe.set(storage.sequence_key(username, name), len(napp['versions']))
+
+
+def main(argv=None):
+    """Rebuild redis from the .napp files of the repository."""
+    parser = argparse.ArgumentParser(
+        prog='napps-server reindex',
+        description='Rebuild redis from the .napp files of the repository.')
+    parser.add_argument('--repo', default=config.NAPP_REPO,
+                        help='repository path (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='number of processes (default: number of CPUs)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='napps per pipeline (default: %(default)s)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only show what would change')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    archives, errors = scan_repository(args.repo, args.jobs)
+    for error in errors:
+        print('{}: {}'.format(error['path'], error['error']), file=sys.stderr)
+    napps = plan(archives)
+    scanned = time.perf_counter() - start
+
+    if args.dry_run:
+        for change in diff(napps, args.batch_size):
+            print(change)
+    else:
+        load(napps, args.batch_size, args.repo)
+
+    megabytes = sum(item['size'] for item in archives) / 1024 / 1024
+    print('{} archives ({} errors), {} napps: scanned {:.1f} MiB in {:.2f}s, '
+          'total {:.2f}s.'.format(len(archives), len(errors), len(napps),
+                                  megabytes, scanned,
+                                  time.perf_counter() - start),
+          file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
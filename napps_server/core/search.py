@@ -0,0 +1,214 @@
+"""Module with the full-text search index of napps.
+
+The index is an inverted index kept in redis: each term has a sorted set of
+napp keys (``search:term:<term>``) scored by how relevant the term is to the
+napp, and each napp has the set of its terms (``napp:<username>/<name>:terms``)
+so it can be removed from the index. A search only reads the postings of the
+terms being searched.
+"""
+import re
+import uuid
+
+from napps_server import config
+
+db_con = config.DB_CON
+
+#: Weight of a term according to the field where it was found.
+FIELD_WEIGHTS = {'name': 5, 'tags': 3, 'description': 2,
+                 'long_description': 1}
+
+#: Seconds the intersection of a search is kept if it is not deleted, e.g.
+#: because the process died before.
+RESULT_TTL = 60
+
+WORD_RE = re.compile(r'[a-z0-9]+(?:_[a-z0-9]+)*')
+
+
+def tokenize(text):
+    """Method used to split a text into search terms.
+
+    Words joined by underscores (e.g. of_core) are kept as a term and also
+    split into their parts.
+
+    Parameters:
+        text (string): Text to be split.
+
+    Returns:
+        terms (list): Lowercase terms found, in order, with repetitions.
+    """
+    terms = []
+    for word in WORD_RE.findall((text or '').lower()):
+        terms.append(word)
+        if '_' in word:
+            terms.extend(part for part in word.split('_') if part)
+    return terms
+
+
+def napp_terms(fields):
+    """Method used to compute the score of each term of a napp.
+
+    Parameters:
+        fields (dict): Napp attributes, as returned by Napp.as_dict.
+
+    Returns:
+        terms (dict): Score of each term.
+    """
+    scores = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        value = fields.get(field) or ''
+        if isinstance(value, (list, tuple, set)):
+            value = ' '.join(value)
+        for term in tokenize(value):
+            scores[term] = scores.get(term, 0) + weight
+    return scores
+
+
+def term_key(term):
+    """Method used to build the redis key of the postings of a term."""
+    return "search:term:{}".format(term)
+
+
+def terms_key(napp_key):
+    """Method used to build the redis key of the terms of a napp."""
+    return "{}:terms".format(napp_key)
+
+
+def index(napp_key, fields, pipe=None, old_terms=None):
+    """Method used to add or update a napp in the index.
+
+    Parameters:
+        napp_key (string): Redis key of the napp.
+        fields (dict): Napp attributes. An empty dict removes the napp.
+        pipe (:class:`redis.client.Pipeline`): Pipeline where the changes are
+            queued. If not given, they are executed at once.
+        old_terms (set): Terms currently indexed for the napp, if already
+            fetched.
+    """
+    if old_terms is None:
+        old_terms = db_con.smembers(terms_key(napp_key))
+    scores = napp_terms(fields)
+
+    execute = pipe is None
+    pipe = pipe if pipe is not None else db_con.pipeline()
+    for term in old_terms.difference(scores):
+        pipe.zrem(term_key(term), napp_key)
+    for term, score in scores.items():
+        pipe.zadd(term_key(term), {napp_key: score})
+    pipe.delete(terms_key(napp_key))
+    if scores:
+        pipe.sadd(terms_key(napp_key), *scores)
+    if execute:
+        pipe.execute()
+
+
+def unindex(napp_key, pipe=None):
+    """Method used to remove a napp from the index.
+
+    Parameters:
+        napp_key (string): Redis key of the napp.
+        pipe (:class:`redis.client.Pipeline`): Pipeline where the changes are
+            queued. If not given, they are executed at once.
+    """
+    index(napp_key, {}, pipe)
+
+
+def search(query, limit=None):
+    """Method used to search napps matching every term of a query.
+
+    Parameters:
+        query (string): Text to be searched.
+        limit (int): Maximum number of results.
+
+    Returns:
+        napp_keys (list): Redis keys of the napps found, most relevant first.
+    """
+    limit = limit or config.SEARCH_LIMIT
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return []
+    if len(terms) == 1:
+        return db_con.zrevrange(term_key(terms[0]), 0, limit - 1)
+
+    result_key = "search:result:{}".format(uuid.uuid4().hex)
+    pipe = db_con.pipeline(transaction=False)
+    pipe.zinterstore(result_key, [term_key(term) for term in terms])
+    pipe.expire(result_key, RESULT_TTL)
+    pipe.zrevrange(result_key, 0, limit - 1)
+    pipe.delete(result_key)
+    return pipe.execute()[2]
+
+
+def completion_key(kind):
+    """Method used to build the redis key of a prefix index.
+
+    Parameters:
+        kind (string): Kind of the names indexed, 'napps' or 'users'.
+    """
+    return "autocomplete:{}".format(kind)
+
+
+def _completions(value, terms):
+    """Build the members of a prefix index for a value.
+
+    Each member is the lowercase term followed by the value itself, so all
+    members share the same score and are ordered by term.
+    """
+    return {"{}\0{}".format(term.lower(), value) for term in terms}
+
+
+def add_completion(kind, value, terms, pipe=None):
+    """Method used to make a value completable by the given terms.
+
+    Parameters:
+        kind (string): Kind of the names indexed, 'napps' or 'users'.
+        value (string): Value returned by the completion.
+        terms (iterable): Terms whose prefixes complete to the value.
+        pipe (:class:`redis.client.Pipeline`): Pipeline where the changes are
+            queued. If not given, they are executed at once.
+    """
+    client = pipe if pipe is not None else db_con
+    client.zadd(completion_key(kind),
+                {member: 0 for member in _completions(value, terms)})
+
+
+def remove_completion(kind, value, terms, pipe=None):
+    """Method used to remove a value from a prefix index.
+
+    Parameters:
+        kind (string): Kind of the names indexed, 'napps' or 'users'.
+        value (string): Value returned by the completion.
+        terms (iterable): Terms whose prefixes completed to the value.
+        pipe (:class:`redis.client.Pipeline`): Pipeline where the changes are
+            queued. If not given, they are executed at once.
+    """
+    client = pipe if pipe is not None else db_con
+    client.zrem(completion_key(kind), *_completions(value, terms))
+
+
+def complete(kind, prefix, limit=None):
+    """Method used to return the values matching a prefix.
+
+    The query costs O(log N + K), K being the number of values returned.
+
+    Parameters:
+        kind (string): Kind of the names indexed, 'napps' or 'users'.
+        prefix (string): Prefix typed so far.
+        limit (int): Maximum number of values.
+
+    Returns:
+        values (list): Values matching the prefix, ordered by term.
+    """
+    limit = limit or config.AUTOCOMPLETE_LIMIT
+    prefix = prefix.lower()
+    # A value may be completable by several terms (e.g. a napp by both
+    # 'username/name' and 'name'), so fetch some more to fill the limit.
+    members = db_con.zrangebylex(completion_key(kind), '[' + prefix,
+                                 '[' + prefix + chr(0x10ffff), 0, limit * 2)
+    values = []
+    for member in members:
+        value = member.split('\0', 1)[1]
+        if value not in values:
+            values.append(value)
+            if len(values) == limit:
+                break
+    return values
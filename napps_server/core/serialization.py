@@ -0,0 +1,134 @@
+"""Module used to encode the JSON responses of napps-server.
+
+The fastest encoder installed is used: orjson, then ujson, then the json
+module of the standard library. JSON_ENCODER may force one of them. Whatever
+the encoder, values are encoded as Flask's jsonify would: datetimes as HTTP
+dates, sets and tuples as lists.
+"""
+import json
+from datetime import date, datetime
+
+from flask import Response
+from werkzeug.http import http_date
+
+from napps_server import config
+
+ENCODERS = ('orjson', 'ujson', 'json')
+
+MIMETYPE = 'application/json'
+
+
+def _default(obj):
+    """Encode the values the encoders do not know."""
+    if isinstance(obj, (datetime, date)):
+        return http_date(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8')
+    raise TypeError('Object of type {} is not JSON serializable'.format(
+        type(obj).__name__))
+
+
+def _orjson_dumps():
+    """Build the encoder using orjson."""
+    import orjson
+
+    # Let _default encode datetimes, as orjson would use ISO 8601.
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=options)
+    return dumps
+
+
+def _ujson_dumps():
+    """Build the encoder using ujson."""
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False,
+                           escape_forward_slashes=False,
+                           default=_default).encode('utf-8')
+    # Older releases have no 'default' argument.
+    dumps({'check': datetime(1970, 1, 1)})
+    return dumps
+
+
+def _json_dumps():
+    """Build the encoder using the json module of the standard library."""
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'),
+                               default=_default)
+
+    def dumps(obj):
+        return encoder.encode(obj).encode('utf-8')
+    return dumps
+
+
+_BUILDERS = {'orjson': _orjson_dumps, 'ujson': _ujson_dumps,
+             'json': _json_dumps}
+
+
+def load_encoder(name=None):
+    """Method used to get a JSON encoder.
+
+    Parameters:
+        name (string): 'orjson', 'ujson' or 'json'. If not given, the first
+                       one installed is used.
+
+    Returns:
+        encoder (tuple): The name of the encoder and a function encoding a
+                         value to UTF-8 JSON bytes.
+    Raises:
+        ImportError: If the requested encoder is not installed.
+    """
+    if name is not None:
+        return name, _BUILDERS[name]()
+    for candidate in ENCODERS:
+        try:
+            return candidate, _BUILDERS[candidate]()
+        except (ImportError, TypeError):
+            continue
+
+
+encoder_name, _dumps = load_encoder(config.JSON_ENCODER)
+
+
+def dumps(obj):
+    """Method used to encode a value as JSON.
+
+    Parameters:
+        obj: Value to be encoded.
+
+    Returns:
+        json (bytes): UTF-8 JSON.
+    """
+    return _dumps(obj)
+
+
+def raw_response(body, status=200, headers=None):
+    """Method used to answer with a JSON document already encoded.
+
+    Parameters:
+        body (bytes): UTF-8 JSON. A string is also accepted.
+        status (int): HTTP status code.
+        headers (dict): Additional headers.
+
+    Returns:
+        response (:class:`flask.Response`): The response.
+    """
+    return Response(body, status, headers, mimetype=MIMETYPE)
+
+
+def json_response(obj, status=200, headers=None):
+    """Method used to answer with a value encoded as JSON.
+
+    Parameters:
+        obj: Value to be encoded.
+        status (int): HTTP status code.
+        headers (dict): Additional headers.
+
+    Returns:
+        response (:class:`flask.Response`): The response.
+    """
+    return raw_response(_dumps(obj), status, headers)
@@ -0,0 +1,283 @@
+"""Module with the content-addressed storage of .napp files.
+
+Every .napp file is stored once, as a blob named after its SHA-256 digest
+(``NAPP_REPO/.blobs/<2 first hex digits>/<digest>.napp``), no matter how many
+times it is uploaded. Versions of a napp are metadata in redis referencing the
+blobs, so listing or resolving them never touches the filesystem:
+
+- ``napp:<username>/<name>:version_seq``: atomic sequence of versions;
+- ``napp:<username>/<name>:versions``: sorted set of version filenames, scored
+  by their sequence number. The highest one is the latest version;
+- ``napp:<username>/<name>:version:<filename>``: hash with the filename,
+  sequence, digest, size and upload time of a version;
+- ``blob:<digest>:refs``: number of versions referencing a blob.
+
+Blobs no longer referenced are listed in ``blobs:garbage`` and removed by
+:func:`collect_garbage`, run by ``napps-server gc``.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+from time import strftime
+
+from napps_server import config
+
+db_con = config.DB_CON
+
+GARBAGE_KEY = 'blobs:garbage'
+
+
+def blobs_dir(repo=None):
+    """Method used to return the directory of blobs.
+
+    Parameters:
+        repo (string): Repository path. Defaults to NAPP_REPO.
+
+    Returns:
+        path (string): Directory of the blobs, inside the repository.
+    """
+    return os.path.join(repo or config.NAPP_REPO, '.blobs')
+
+
+def blob_path(digest, repo=None):
+    """Method used to return the path of a blob.
+
+    Parameters:
+        digest (string): SHA-256 of the blob.
+        repo (string): Repository path. Defaults to NAPP_REPO.
+
+    Returns:
+        path (string): Path of the blob.
+    """
+    return os.path.join(blobs_dir(repo), digest[:2], digest + '.napp')
+
+
+def sequence_key(username, name):
+    """Method used to build the redis key of the version sequence of a napp."""
+    return "napp:{}/{}:version_seq".format(username, name)
+
+
+def versions_key(username, name):
+    """Method used to build the redis key of the versions index of a napp."""
+    return "napp:{}/{}:versions".format(username, name)
+
+
+def version_key(username, name, filename):
+    """Method used to build the redis key of a version of a napp."""
+    return "napp:{}/{}:version:{}".format(username, name, filename)
+
+
+def refs_key(digest):
+    """Method used to build the redis key of the references to a blob."""
+    return "blob:{}:refs".format(digest)
+
+
+def _blob_lock(digest):
+    """Return the lock serializing the publication and removal of a blob."""
+    return db_con.lock("blob:{}:lock".format(digest), timeout=60,
+                       blocking_timeout=60)
+
+
+def store_blob(incoming):
+    """Method used to store an uploaded file as a referenced blob.
+
+    If a blob with the same digest already exists, the upload is discarded
+    before being written to the repository, so identical uploads cost no
+    extra disk space, nor any write for uploads kept in memory.
+
+    Parameters:
+        incoming (:class:`napps_server.core.uploads.IncomingFile`):
+            The uploaded file.
+
+    Returns:
+        digest (string): SHA-256 of the blob.
+    """
+    digest = incoming.digest
+    path = blob_path(digest)
+    with _blob_lock(digest):
+        if os.path.exists(path):
+            incoming.discard()
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            incoming.publish(path)
+        # Only referenced once in place, so a failed publish leaves no
+        # reference to a missing blob.
+        db_con.incr(refs_key(digest))
+    return digest
+
+
+def release_blob(digest, pipe=None):
+    """Method used to drop a reference to a blob.
+
+    Parameters:
+        digest (string): SHA-256 of the blob.
+        pipe (:class:`redis.client.Pipeline`): Pipeline where the changes are
+            queued. If not given, they are executed at once.
+    """
+    client = pipe if pipe is not None else db_con.pipeline()
+    client.decr(refs_key(digest))
+    client.sadd(GARBAGE_KEY, digest)
+    if pipe is None:
+        client.execute()
+
+
+def versioned_name(name, sequence, date=None):
+    """Build the napp filename with a date (YYYYMMDD) and a sequence number.
+
+    The current date is used if no date is given.
+    """
+    return "{}-{}-{}.napp".format(name, date or strftime("%Y%m%d"), sequence)
+
+
+def add_version(username, name, incoming):
+    """Method used to store a new version of a napp and make it the latest.
+
+    The version number comes from an atomic redis sequence, so concurrent
+    uploads always get distinct filenames.
+
+    Parameters:
+        username (string): Owner of the napp.
+        name (string): Name of the napp.
+        incoming (:class:`napps_server.core.uploads.IncomingFile`):
+            The uploaded file.
+
+    Returns:
+        version (dict): Filename, sequence, digest, size and upload time of
+                        the new version.
+    """
+    sequence = db_con.incr(sequence_key(username, name))
+    digest = store_blob(incoming)
+    version = {'filename': versioned_name(name, sequence),
+               'sequence': sequence,
+               'digest': digest,
+               'size': incoming.size,
+               'uploaded_at': datetime.utcnow().isoformat() + 'Z'}
+
+    pipe = db_con.pipeline()
+    pipe.hmset(version_key(username, name, version['filename']), version)
+    pipe.zadd(versions_key(username, name), {version['filename']: sequence})
+    pipe.execute()
+    return version
+
+
+def remove_version(username, name, version):
+    """Method used to drop a version of a napp, releasing its blob.
+
+    Parameters:
+        username (string): Owner of the napp.
+        name (string): Name of the napp.
+        version (dict): Version returned by :func:`add_version`.
+    """
+    pipe = db_con.pipeline()
+    release_blob(version['digest'], pipe)
+    pipe.delete(version_key(username, name, version['filename']))
+    pipe.zrem(versions_key(username, name), version['filename'])
+    pipe.execute()
+
+
+def _parse_version(attributes):
+    """Convert the fields of a version hash to their types."""
+    attributes['sequence'] = int(attributes['sequence'])
+    attributes['size'] = int(attributes['size'])
+    return attributes
+
+
+def list_versions(username, name):
+    """Method used to list the versions of a napp, latest first.
+
+    Parameters:
+        username (string): Owner of the napp.
+        name (string): Name of the napp.
+
+    Returns:
+        versions (list): Filename, sequence, digest, size and upload time of
+                         every version stored.
+    """
+    filenames = db_con.zrevrange(versions_key(username, name), 0, -1)
+    pipe = db_con.pipeline(transaction=False)
+    for filename in filenames:
+        pipe.hgetall(version_key(username, name, filename))
+    return [_parse_version(version) for version in pipe.execute() if version]
+
+
+def resolve(username, name, filename=None):
+    """Method used to find a version of a napp.
+
+    Parameters:
+        username (string): Owner of the napp.
+        name (string): Name of the napp.
+        filename (string): Filename or sequence number of the version. The
+                           latest version is returned if not given.
+
+    Returns:
+        version (dict): Filename, sequence, digest, size, upload time and path
+                        of the version, or None if it does not exist.
+    """
+    if filename is None:
+        found = db_con.zrevrange(versions_key(username, name), 0, 0)
+    elif filename.isdigit():
+        found = db_con.zrangebyscore(versions_key(username, name),
+                                     filename, filename)
+    else:
+        found = [filename]
+    if not found:
+        return None
+    filename = found[0]
+    version = db_con.hgetall(version_key(username, name, filename))
+    if not version:
+        return None
+    version = _parse_version(version)
+    version['path'] = blob_path(version['digest'])
+    return version
+
+
+def remove_napp(username, name):
+    """Method used to drop every version of a napp.
+
+    Parameters:
+        username (string): Owner of the napp.
+        name (string): Name of the napp.
+    """
+    versions = list_versions(username, name)
+    pipe = db_con.pipeline()
+    for version in versions:
+        release_blob(version['digest'], pipe)
+        pipe.delete(version_key(username, name, version['filename']))
+    pipe.delete(versions_key(username, name))
+    pipe.execute()
+
+
+def collect_garbage():
+    """Method used to remove the blobs no longer referenced.
+
+    Returns:
+        removed (int): Number of blobs removed.
+    """
+    removed = 0
+    for digest in db_con.smembers(GARBAGE_KEY):
+        with _blob_lock(digest):
+            refs = int(db_con.get(refs_key(digest)) or 0)
+            if refs <= 0:
+                try:
+                    os.remove(blob_path(digest))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                db_con.delete(refs_key(digest))
+            db_con.srem(GARBAGE_KEY, digest)
+    return removed
+
+
+def main(argv=None):
+    """Remove the .napp blobs no longer referenced."""
+    parser = argparse.ArgumentParser(
+        prog='napps-server gc',
+        description='Remove the .napp blobs no longer referenced.')
+    parser.parse_args(argv)
+    print('{} blob(s) removed.'.format(collect_garbage()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
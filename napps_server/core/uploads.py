@@ -0,0 +1,169 @@
+"""Module used to receive uploaded files.
+
+Uploads are streamed in chunks while their SHA-256 digest and size are
+computed. They are kept in memory up to UPLOAD_SPOOL_SIZE bytes, then moved
+to a temporary file inside the repository filesystem, so memory usage is
+bounded. Uploads bigger than the configured limit are aborted as soon as the
+limit is exceeded and files are published with an atomic rename.
+"""
+import hashlib
+import io
+import os
+import tempfile
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from napps_server import config
+
+
+def incoming_dir():
+    """Method used to return the directory of uploads in progress.
+
+    It is inside the repository, so publishing a file is a rename within the
+    same filesystem.
+
+    Returns:
+        path (string): Directory of the temporary files.
+    """
+    return os.path.join(config.NAPP_REPO, '.incoming')
+
+
+class IncomingFile(object):
+    """Writable spooled file that hashes and counts what is written."""
+
+    def __init__(self, directory=None, max_size=None, spool_size=None):
+        """Constructor of IncomingFile class.
+
+        Parameters:
+            directory (string): Directory of the temporary file.
+            max_size (int): Maximum size in bytes, None for no limit.
+            spool_size (int): Size in bytes up to which the file is kept in
+                memory. Defaults to UPLOAD_SPOOL_SIZE.
+        """
+        self.directory = directory or incoming_dir()
+        self.spool_size = config.UPLOAD_SPOOL_SIZE if spool_size is None \
+            else spool_size
+        self.path = None
+        self._file = io.BytesIO()
+        self._sha256 = hashlib.sha256()
+        self.max_size = max_size
+        self.size = 0
+        self.published = False
+
+    def __getattr__(self, name):
+        """Delegate the remaining file methods (read, seek...)."""
+        if name == '_file':
+            raise AttributeError(name)
+        return getattr(self._file, name)
+
+    @property
+    def digest(self):
+        """Method used to return the SHA-256 of the bytes written.
+
+        Returns:
+            digest (string): Hexadecimal digest.
+        """
+        return self._sha256.hexdigest()
+
+    def _temporary_file(self, directory):
+        """Create a temporary file in a directory, returning its path."""
+        os.makedirs(directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=directory, suffix='.part')
+        return os.fdopen(fd, 'w+b'), path
+
+    def _rollover(self):
+        """Move the bytes kept in memory to a temporary file."""
+        buffer = self._file
+        self._file, self.path = self._temporary_file(self.directory)
+        self._file.write(buffer.getvalue())
+        self._file.seek(buffer.tell())
+
+    def write(self, data):
+        """Method used to write a chunk of the upload.
+
+        Parameters:
+            data (bytes): Chunk received.
+        Raises:
+            RequestEntityTooLarge: If the maximum size is exceeded. The
+                temporary file is removed.
+        """
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            self.discard()
+            raise RequestEntityTooLarge()
+        self._sha256.update(data)
+        if self.path is None and self.size > self.spool_size:
+            self._rollover()
+        return self._file.write(data)
+
+    def publish(self, destination):
+        """Method used to move the file to its final path atomically.
+
+        Files kept in memory are written next to the destination first.
+
+        Parameters:
+            destination (string): Final path of the file.
+        """
+        if self.path is None:
+            buffer = self._file
+            self._file, self.path = self._temporary_file(
+                os.path.dirname(destination))
+            self._file.write(buffer.getvalue())
+        self._file.close()
+        os.replace(self.path, destination)
+        self.published = True
+
+    def discard(self):
+        """Method used to drop the file, removing the temporary one if any."""
+        self._file.close()
+        if self.path is not None and not self.published:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        """Close the file, removing it if it was not published.
+
+        Werkzeug closes the uploaded files at the end of the request, so
+        uploads that were not published never leak.
+        """
+        self.discard()
+
+
+class UploadRequest(Request):
+    """Flask request that streams uploaded files into IncomingFiles."""
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        """Return the file where an uploaded file is written."""
+        return IncomingFile(max_size=config.MAX_NAPP_SIZE)
+
+
+def ingest(file_storage, max_size=None):
+    """Method used to get the IncomingFile of an uploaded file.
+
+    Uploads parsed by :class:`UploadRequest` are already IncomingFiles.
+    Otherwise, the file is copied in chunks into one.
+
+    Parameters:
+        file_storage (:class:`werkzeug.datastructures.FileStorage`):
+            The uploaded file.
+        max_size (int): Maximum size in bytes, None for no limit.
+
+    Returns:
+        incoming (:class:`IncomingFile`): The uploaded file, with its digest
+            and size.
+    """
+    if isinstance(file_storage.stream, IncomingFile):
+        return file_storage.stream
+
+    incoming = IncomingFile(max_size=max_size)
+    while True:
+        chunk = file_storage.stream.read(config.UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        incoming.write(chunk)
+    incoming.flush()
+    return incoming
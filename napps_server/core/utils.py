@@ -1,9 +1,14 @@
 """Module with utilities used into napps-server modules."""
 import hashlib
 import os
+import threading
+import time
 
 from flask import Response
-from jinja2 import Template
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from napps_server import config
+from napps_server.core import metrics
 
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DIR = os.path.join(APP_ROOT, 'templates')
@@ -16,11 +21,116 @@ def authenticate():
                     {'WWW-Authenticate': 'Basic realm="Login Required"'})
 
 
+def unavailable():
+    """Method used to send a 503 response when the auth can't be verified."""
+    return Response('Too many authentication requests, try again later.',
+                    503, {'Retry-After': str(config.BCRYPT_RETRY_AFTER)})
+
+
+class TemplateRegistry(object):
+    """Class used to compile templates once and render them.
+
+    Templates are compiled on first use (or all at once by :meth:`preload`)
+    and kept in memory. In development mode, the files are checked for
+    changes before each render.
+    """
+
+    def __init__(self, directory=TEMPLATE_DIR, auto_reload=False,
+                 bytecode_cache_dir=None):
+        """Constructor of TemplateRegistry class.
+
+        Parameters:
+            directory (string): Directory with the templates.
+            auto_reload (bool): Recompile templates whose file changed.
+            bytecode_cache_dir (string): Directory where the compiled
+                templates are cached between runs, if any.
+        """
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+        self.environment = Environment(loader=FileSystemLoader(directory),
+                                       auto_reload=auto_reload,
+                                       bytecode_cache=bytecode_cache,
+                                       cache_size=-1)
+        self._timings = {}
+        self._compile_times = {}
+        self._lock = threading.Lock()
+
+    def preload(self):
+        """Method used to compile every template of the directory.
+
+        Returns:
+            names (list): Names of the templates compiled.
+        """
+        names = self.environment.list_templates()
+        for name in names:
+            start = time.perf_counter()
+            self.environment.get_template(name)
+            self._compile_times[name] = time.perf_counter() - start
+        return names
+
+    def render(self, filename, context):
+        """Method used to render a template.
+
+        Parameters:
+            filename (string): Name of the template.
+            context (dict): Variables available to the template.
+        Returns:
+            text (string): The rendered template.
+        """
+        start = time.perf_counter()
+        text = self.environment.get_template(filename).render(context)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            count, total = self._timings.get(filename, (0, 0.0))
+            self._timings[filename] = (count + 1, total + elapsed)
+        return text
+
+    @property
+    def stats(self):
+        """Method used to return how long compiling and rendering take.
+
+        Returns:
+            stats (dict): Seconds spent compiling by :meth:`preload`, number
+                          of renders and total seconds spent rendering,
+                          indexed by template name.
+        """
+        with self._lock:
+            stats = {name: {'compile_seconds': seconds, 'count': 0,
+                            'seconds': 0.0}
+                     for name, seconds in self._compile_times.items()}
+            for name, (count, total) in self._timings.items():
+                stats.setdefault(name, {'compile_seconds': None})
+                stats[name].update(count=count, seconds=total)
+            return stats
+
+
+templates = TemplateRegistry(auto_reload=config.TEMPLATES_AUTO_RELOAD,
+                             bytecode_cache_dir=config.TEMPLATES_CACHE_DIR)
+
+
+def _template_stats(field):
+    """Read a field of the template stats, indexed by template name."""
+    return {(name,): stats[field]
+            for name, stats in templates.stats.items()
+            if stats[field] is not None}
+
+
+metrics.registry.register(metrics.Gauge(
+    'napps_template_compile_seconds', 'Time spent compiling templates.',
+    ('template',), function=lambda: _template_stats('compile_seconds')))
+metrics.registry.register(metrics.Counter(
+    'napps_template_renders_total', 'Templates rendered.',
+    ('template',), function=lambda: _template_stats('count')))
+metrics.registry.register(metrics.Counter(
+    'napps_template_render_seconds_total', 'Time spent rendering templates.',
+    ('template',), function=lambda: _template_stats('seconds')))
+
+
 def render_template(filename, context):
     """Method used to render the user page."""
-    with open(os.path.join(TEMPLATE_DIR, filename), 'r') as f:
-        template = Template(f.read())
-        return template.render(context)
+    return templates.render(filename, context)
 
 
 def generate_hash():
@@ -75,3 +185,34 @@ def get_request_data(request, schema):
     content['username'] = content.get('username') or content.get('author')
 
     return content
+
+
+def get_pagination(params):
+    """Extract the cursor and limit of a paginated request.
+
+    The 'length' parameter is still accepted as an alias of 'limit'. As
+    before, an empty or non-positive length means no limit.
+
+    Args:
+        params (dict): The query string arguments of the request.
+    Return:
+        pagination (tuple): The cursor and the limit, or (None, None) if the
+            request is not paginated.
+    Raises:
+        ValueError: If limit is not a positive integer, or length is not an
+                    integer.
+    """
+    cursor = params.get('cursor') or None
+    limit = params.get('limit')
+    if limit is None and params.get('length'):
+        length = int(params['length'])
+        limit = length if length > 0 else None
+    if limit is None:
+        if cursor is None:
+            return None, None
+        return cursor, config.DEFAULT_PAGE_SIZE
+
+    limit = int(limit)
+    if limit <= 0:
+        raise ValueError('limit must be a positive integer')
+    return cursor, min(limit, config.MAX_PAGE_SIZE)
@@ -0,0 +1,200 @@
+"""Module with the napps-server command line.
+
+``napps-server`` serves the application with gunicorn: several worker
+processes (or threads), created by forking a master that has already loaded
+the application, so the workers share its memory. Workers are recycled after
+SERVER_MAX_REQUESTS requests, finishing the requests in progress first.
+
+Signals sent to the master:
+
+- HUP: reload the configuration and replace every worker gracefully, with no
+  request refused;
+- USR2, then WINCH and QUIT to the old master: upgrade to a new version of
+  the code with no downtime;
+- TERM: stop gracefully.
+
+The maintenance commands are subcommands: ``napps-server reindex``,
+``napps-server migrate`` and ``napps-server gc``.
+"""
+import argparse
+import os
+import sys
+
+from napps_server import config
+from napps_server.core import codec, reindex, storage
+from napps_server.core.models import Napp, Token, User
+
+
+def migrate(argv=None):
+    """Upgrade the data stored by older versions of napps-server.
+
+    The fields stored in the legacy format are rewritten, the ordered and
+    autocomplete indexes of users and napps are rebuilt and the tokens stored
+    without redis expiration get one, or are deleted if already expired.
+    """
+    status = codec.main(argv)
+    for label, model in (('users', User), ('napps', Napp)):
+        print('{}: {} indexed.'.format(label, model.rebuild_index()))
+    print('tokens: {} without expiration updated.'.format(
+        Token.expire_legacy_tokens()))
+    return status
+
+
+#: Maintenance commands, run instead of the server.
+COMMANDS = {'reindex': reindex.main, 'migrate': migrate,
+            'gc': storage.main}
+
+WORKER_CLASSES = {'processes': 'sync', 'threads': 'gthread',
+                  'asgi': 'uvicorn.workers.UvicornWorker'}
+
+
+def default_workers():
+    """Method used to compute the default number of worker processes.
+
+    Returns:
+        workers (int): Twice the number of CPUs plus one.
+    """
+    return 2 * (os.cpu_count() or 1) + 1
+
+
+def load_application(asgi=False):
+    """Method used to create the application served by the workers.
+
+    Parameters:
+        asgi (bool): Create the asyncio application instead of the Flask one.
+
+    Returns:
+        app: The WSGI or ASGI application.
+    """
+    if asgi:
+        from napps_server.aio.app import create_app
+    else:
+        from napps_server.app import create_app
+    return create_app()
+
+
+def gunicorn_options(args):
+    """Method used to build the gunicorn settings from the command line.
+
+    Parameters:
+        args (:class:`argparse.Namespace`): Parsed command line.
+
+    Returns:
+        options (dict): gunicorn settings.
+    """
+    worker_type = 'asgi' if args.asgi else args.worker_type
+    return {'bind': args.bind,
+            'workers': args.workers or default_workers(),
+            'worker_class': WORKER_CLASSES[worker_type],
+            'threads': args.threads if worker_type == 'threads' else 1,
+            'preload_app': True,
+            'max_requests': args.max_requests,
+            'max_requests_jitter': args.max_requests_jitter,
+            'timeout': args.timeout,
+            'graceful_timeout': args.graceful_timeout,
+            'keepalive': args.keepalive,
+            'proc_name': 'napps-server'}
+
+
+def serve(args):
+    """Method used to serve the application with gunicorn until stopped."""
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        """gunicorn application loading napps-server."""
+
+        def load_config(self):
+            """Apply the settings of the command line."""
+            for name, value in gunicorn_options(args).items():
+                self.cfg.set(name, value)
+
+        def load(self):
+            """Create the application, once, in the master process."""
+            return load_application(args.asgi)
+
+    Server().run()
+
+
+def serve_dev(args):
+    """Method used to serve the application with the reloader until stopped.
+
+    The Flask application runs in Flask's development server, with the
+    debugger. The asyncio one runs in uvicorn.
+    """
+    host, _, port = args.bind.rpartition(':')
+    if args.asgi:
+        import uvicorn
+        uvicorn.run('napps_server.aio.app:create_app', factory=True,
+                    host=host or '127.0.0.1', port=int(port), reload=True,
+                    reload_dirs=[os.path.dirname(__file__)],
+                    log_level='debug')
+    else:
+        load_application().run(host=host or None, port=int(port),
+                               debug=True)
+
+
+def parse_args(argv=None):
+    """Method used to parse the command line of the server."""
+    parser = argparse.ArgumentParser(
+        prog='napps-server',
+        description='Serve the napps-server application. Maintenance '
+                    'commands: {}.'.format(', '.join(sorted(COMMANDS))))
+    parser.add_argument('-b', '--bind', default=config.SERVER_BIND,
+                        help='address to listen on (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int,
+                        default=config.SERVER_WORKERS,
+                        help='worker processes (default: 2 * CPUs + 1)')
+    parser.add_argument('-k', '--worker-type',
+                        choices=['processes', 'threads'],
+                        default=config.SERVER_WORKER_TYPE,
+                        help='one request at a time per process, or several '
+                             'threads per process (default: %(default)s)')
+    parser.add_argument('--threads', type=int, default=config.SERVER_THREADS,
+                        help='threads per process, for the threads worker '
+                             'type (default: %(default)s)')
+    parser.add_argument('--asgi', action='store_true',
+                        default=config.SERVER_ASGI,
+                        help='serve the asyncio application with uvicorn '
+                             'workers')
+    parser.add_argument('--max-requests', type=int,
+                        default=config.SERVER_MAX_REQUESTS,
+                        help='requests before a worker is recycled, 0 to '
+                             'disable (default: %(default)s)')
+    parser.add_argument('--max-requests-jitter', type=int,
+                        default=config.SERVER_MAX_REQUESTS_JITTER,
+                        help='random extra requests, so workers are not '
+                             'recycled together (default: %(default)s)')
+    parser.add_argument('--timeout', type=int, default=config.SERVER_TIMEOUT,
+                        help='seconds before a silent worker is restarted '
+                             '(default: %(default)s)')
+    parser.add_argument('--graceful-timeout', type=int,
+                        default=config.SERVER_GRACEFUL_TIMEOUT,
+                        help='seconds given to workers to finish their '
+                             'requests (default: %(default)s)')
+    parser.add_argument('--keepalive', type=int,
+                        default=config.SERVER_KEEPALIVE,
+                        help='seconds to wait for requests on a keep-alive '
+                             'connection (default: %(default)s)')
+    parser.add_argument('--dev', action='store_true',
+                        help="use Flask's development server, with the "
+                             'debugger and the reloader (uvicorn with the '
+                             'reloader with --asgi)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Serve napps-server, or run one of its maintenance commands."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
+    args = parse_args(argv)
+    if args.dev:
+        serve_dev(args)
+    else:
+        serve(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -94,9 +94,16 @@ setup(name='napps-server',
       author_email='of-ng-dev@ncc.unesp.br',
       license='MIT',
       test_suite='tests',
-      scripts=['bin/napps-server'],
+      scripts=['bin/napps-render-readmes', 'bin/napps-mailer'],
+      entry_points={
+          'console_scripts': ['napps-server = napps_server.server:main'],
+      },
       packages=find_packages(exclude=['tests']),
       install_requires=requirements,
+      extras_require={
+          # Asyncio application: napps_server.aio.app
+          'asgi': ['starlette', 'a2wsgi', 'uvicorn'],
+      },
       cmdclass={
           'lint': Linter,
           'clean': Cleaner,
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Measure the cost of decoding the encoded fields of napps and users.
+
+Compares the former eval-based decoding with the codec, for values stored in
+the legacy format (Python literals) and in the current one (JSON). No redis
+server is needed: the hashes are built in memory.
+"""
+import argparse
+import timeit
+
+from napps_server.core import codec
+
+NAPP = {'tags': ['openflow', 'switching', 'l2', 'learning', 'kytos'],
+        'napp_dependencies': ['kytos/of_core', 'kytos/topology']}
+USER = {'enabled': True}
+
+
+def legacy_hash(fields):
+    """Store the fields as they were before the codec."""
+    return {key: repr(value) for key, value in fields.items()}
+
+
+def encoded_hash(fields):
+    """Store the fields with the codec."""
+    return {key: codec.encode(value) for key, value in fields.items()}
+
+
+def decode_eval(stored):
+    """Decode the fields as the models used to."""
+    return {key: eval(value) for key, value in stored.items()}
+
+
+def decode_codec(stored):
+    """Decode the fields with the codec."""
+    return {key: codec.decode(value) for key, value in stored.items()}
+
+
+def measure(function, stored, number):
+    """Return the cost of one call, in microseconds (best of 5)."""
+    timer = timeit.Timer(lambda: function(stored))
+    return min(timer.repeat(5, number)) / number * 1e6
+
+
+def main():
+    """Print the per-object decode cost of each strategy."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--number', type=int, default=20000,
+                        help='decodes per measure (default: %(default)s)')
+    args = parser.parse_args()
+
+    print('{:<8} {:>14} {:>14} {:>14}'.format(
+        'object', 'eval (legacy)', 'codec (legacy)', 'codec (j1)'))
+    for name, fields in (('napp', NAPP), ('user', USER)):
+        legacy, encoded = legacy_hash(fields), encoded_hash(fields)
+        assert decode_codec(legacy) == decode_codec(encoded) == fields
+        print('{:<8} {:>11.2f} us {:>11.2f} us {:>11.2f} us'.format(
+            name,
+            measure(decode_eval, legacy, args.number),
+            measure(decode_codec, legacy, args.number),
+            measure(decode_codec, encoded, args.number)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Compare the JSON encoders on a catalog-sized payload.
+
+The payload mimics the body of GET /napps/: a list of napps as returned by
+Napp.as_dict. Encoders that are not installed are skipped. No redis server is
+needed.
+"""
+import argparse
+import timeit
+
+from napps_server.core import serialization
+
+
+def napp(number):
+    """Build a napp as returned by Napp.as_dict."""
+    username, name = 'user{}'.format(number % 50), 'napp{}'.format(number)
+    return {'username': username, 'name': name, 'user': username,
+            'author': username, 'version': '1.0.{}'.format(number),
+            'description': 'Network application number {}'.format(number),
+            'long_description': 'A longer description. ' * 10,
+            'license': 'MIT', 'url': 'https://github.com/kytos/' + name,
+            'tags': ['openflow', 'switching', 'l2', 'kytos'],
+            'napp_dependencies': ['kytos/of_core', 'kytos/topology'],
+            'readme': '<p>' + 'README contents rendered as HTML. ' * 40 +
+                      '</p>',
+            'avatar': 'https://www.gravatar.com/avatar/{:032x}'.format(
+                number)}
+
+
+def main():
+    """Print the encoding time and throughput of each encoder."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--napps', type=int, default=1000,
+                        help='napps in the payload (default: %(default)s)')
+    parser.add_argument('--number', type=int, default=20,
+                        help='encodings per measure (default: %(default)s)')
+    args = parser.parse_args()
+
+    payload = {'napps': [napp(number) for number in range(args.napps)]}
+    print('{:<8} {:>10} {:>12}'.format('encoder', 'ms', 'MiB/s'))
+    for name in serialization.ENCODERS:
+        try:
+            _, dumps = serialization.load_encoder(name)
+        except ImportError:
+            print('{:<8} {:>10}'.format(name, 'not installed'))
+            continue
+        size = len(dumps(payload))
+        timer = timeit.Timer(lambda: dumps(payload))
+        seconds = min(timer.repeat(5, args.number)) / args.number
+        print('{:<8} {:>10.2f} {:>12.1f}'.format(
+            name, seconds * 1000, size / 1024 / 1024 / seconds))
+    print('payload: {} napps, {:.1f} KiB'.format(args.napps, size / 1024))
+
+
+if __name__ == '__main__':
+    main()
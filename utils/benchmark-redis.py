@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Compare redis over TCP and over a unix socket on the catalog endpoint.
+
+Each transport is measured in its own process, configured through the
+NAPPS_* environment variables, doing what GET /napps/ does: a full read of
+the catalog snapshot (HTTP 200) and a revalidation (HTTP 304). Redis must
+listen on both, e.g. with 'unixsocket /tmp/redis.sock' in redis.conf.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def measure(requests):
+    """Time the catalog requests with the current configuration."""
+    from napps_server import config
+    from napps_server.core.models import Catalog
+    from napps_server.core.serialization import raw_response
+
+    etag, _ = Catalog.get()  # Builds the snapshot if needed.
+    results = {}
+    for name, known_etag in (('200', None), ('304', etag)):
+        start = time.perf_counter()
+        for _ in range(requests):
+            raw_response(Catalog.get(known_etag)[1] or b'')
+        results[name] = (time.perf_counter() - start) / requests * 1e6
+    results['pool'] = config.DB_CON.pool_stats()
+    return results
+
+
+def main():
+    """Run the measure of each transport and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--socket', default='/tmp/redis.sock',
+                        help='redis unix socket (default: %(default)s)')
+    parser.add_argument('-n', '--requests', type=int, default=2000,
+                        help='requests per measure (default: %(default)s)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.requests)))
+        return
+
+    print('{:<28} {:>12} {:>12}'.format('transport', '200 (us)', '304 (us)'))
+    for name, extra in (('tcp', {}),
+                        ('unix', {'NAPPS_REDIS_UNIX_SOCKET': args.socket})):
+        env = dict(os.environ, **extra)
+        output = subprocess.check_output(
+            [sys.executable, __file__, '--child', '-n', str(args.requests)],
+            env=env)
+        results = json.loads(output.decode('utf-8'))
+        print('{:<28} {:>12.1f} {:>12.1f}'.format(
+            results['pool']['address'], results['200'], results['304']))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,46 +1,211 @@
-#!/usr/bin/env python3.6
-"""Recursively extract metadata from NApps repo."""
-import json
-import pprint
-import tarfile
+#!/usr/bin/env python3
+"""Recursively extract metadata from NApps repo.
 
+Archives are read in parallel by a pool of processes, and only until their
+kytos.json is found. A manifest keyed by path, mtime and size keeps the
+metadata already extracted, so unchanged archives are skipped on re-runs.
+The output is written as it is produced, either as a single JSON document
+({"napps": {"<path>": <kytos.json>, ...}}) or as JSON Lines.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from napps_server.core.archive import read_metadata_from_path
+from napps_server.core.exceptions import InvalidNappMetaData
+
 WD = Path()
 REPO = WD / 'repo'
+MANIFEST = WD / '.napps-manifest.json'
+
+
+def extract_napp_json(napp_path, with_readme=False):
+    """Return the NApp metadata of a .napp file.
+
+    Args:
+        napp_path (str): Path to the napp file to be extracted.
+        with_readme (bool): Keep the README.rst contents in the 'readme' key.
+
+    Returns:
+        result (tuple): The path, the metadata (None on errors) and the error
+            message (None on success).
+    """
+    try:
+        metadata = read_metadata_from_path(napp_path)
+    except (InvalidNappMetaData, OSError) as error:
+        return napp_path, None, str(error)
+    if not with_readme:
+        metadata.pop('readme', None)
+    return napp_path, metadata, None
+
+
+def load_manifest(manifest_path):
+    """Load the manifest of a previous run, if any.
+
+    Args:
+        manifest_path (Path): Path to the manifest file.
+
+    Returns:
+        manifest (dict): Metadata, mtime and size of each archive path.
+    """
+    try:
+        with manifest_path.open() as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
 
 
-def extract_napp_json(napp_path):
-    """Print NApp metadata based on a .napp file.
+def save_manifest(manifest_path, manifest):
+    """Save the manifest atomically.
 
     Args:
-        napp_path (Path): Path to the napp file to be extracted.
-        extra_comma (bool): If true, and extra comma will be printed after the
-            'json', in order to enable the concatenation between multiple NApps
-            metadata.
+        manifest_path (Path): Path to the manifest file.
+        manifest (dict): Metadata, mtime and size of each archive path.
     """
-    with tarfile.open(napp_path, 'r:xz') as napp:
-        jsonfile = napp.extractfile('kytos.json').read().decode('utf-8')
-        print(jsonfile)
+    tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+    with tmp_path.open('w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(str(tmp_path), str(manifest_path))
 
 
-def walk_on_repo(repo_path=REPO):
-    """Walk on a NApps' repo tree and call the extract_napp_json function.
+class Writer:
+    """Write the extracted metadata as it is produced."""
+
+    def __init__(self, output, json_lines=False):
+        """Start the output document.
+
+        Args:
+            output (file): Text file where the output is written.
+            json_lines (bool): Write JSON Lines instead of a JSON document.
+        """
+        self.output = output
+        self.json_lines = json_lines
+        self.first = True
+        if not json_lines:
+            self.output.write('{"napps": {')
+
+    def write(self, napp_path, metadata):
+        """Write the metadata of a NApp."""
+        if self.json_lines:
+            self.output.write(json.dumps({'path': napp_path,
+                                          'metadata': metadata}) + '\n')
+            return
+        if not self.first:
+            self.output.write(',')
+        self.first = False
+        self.output.write('\n{}: {}'.format(json.dumps(napp_path),
+                                            json.dumps(metadata)))
+
+    def close(self):
+        """Finish the output document."""
+        if not self.json_lines:
+            self.output.write('\n}}\n')
+        self.output.flush()
+
+
+def walk_on_repo(repo_path=REPO, output=sys.stdout, manifest_path=MANIFEST,
+                 jobs=None, json_lines=False, with_readme=False):
+    """Walk on a NApps' repo tree and extract the metadata of every NApp.
 
     Args:
         repo_path (Path): The path to the repository to be 'parsed'.
+        output (file): Text file where the metadata is written.
+        manifest_path (Path): The manifest of the previous run. None disables
+            it.
+        jobs (int): Number of processes. Defaults to the number of CPUs.
+        json_lines (bool): Write JSON Lines instead of a JSON document.
+        with_readme (bool): Also output the README.rst contents.
+
+    Returns:
+        stats (dict): Number of archives found, extracted, cached and failed,
+            bytes extracted and seconds elapsed.
     """
-    napps = repo_path.glob('**/*.napp')
-    first = True
-    for napp in napps:
-        if first:
-            first = False
-            print('{"napps":{ ')
+    start = time.perf_counter()
+    manifest = load_manifest(manifest_path) if manifest_path else {}
+    new_manifest = {}
+    writer = Writer(output, json_lines)
+    stats = {'found': 0, 'extracted': 0, 'cached': 0, 'errors': 0,
+             'bytes': 0}
+
+    pending = {}
+    for napp in sorted(repo_path.glob('**/*.napp')):
+        napp_path = str(napp)
+        stat = napp.stat()
+        entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+        stats['found'] += 1
+        cached = manifest.get(napp_path)
+        if cached and cached['mtime'] == entry['mtime'] and \
+           cached['size'] == entry['size'] and \
+           cached.get('with_readme') == with_readme:
+            new_manifest[napp_path] = cached
+            writer.write(napp_path, cached['metadata'])
+            stats['cached'] += 1
         else:
-            print(',')
-        print('"{}": '.format(napp))
-        extract_napp_json(napp)
-    print('}}')
+            pending[napp_path] = entry
+
+    with ProcessPoolExecutor(jobs) as pool:
+        results = pool.map(extract_napp_json, pending,
+                           [with_readme] * len(pending), chunksize=8)
+        for napp_path, metadata, error in results:
+            if error is not None:
+                print('{}: {}'.format(napp_path, error), file=sys.stderr)
+                stats['errors'] += 1
+                continue
+            entry = pending[napp_path]
+            entry.update(metadata=metadata, with_readme=with_readme)
+            new_manifest[napp_path] = entry
+            writer.write(napp_path, metadata)
+            stats['extracted'] += 1
+            stats['bytes'] += entry['size']
+
+    writer.close()
+    if manifest_path:
+        save_manifest(manifest_path, new_manifest)
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    """Parse the command line and extract the metadata of a NApps repo."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('repo', nargs='?', type=Path, default=REPO,
+                        help='NApps repository (default: ./repo)')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='number of processes (default: number of CPUs)')
+    parser.add_argument('--jsonl', action='store_true',
+                        help='write JSON Lines instead of a JSON document')
+    parser.add_argument('--with-readme', action='store_true',
+                        help='also output the README.rst contents')
+    parser.add_argument('--manifest', type=Path, default=MANIFEST,
+                        help='manifest of extracted archives '
+                             '(default: ./.napps-manifest.json)')
+    parser.add_argument('--no-manifest', action='store_true',
+                        help='extract every archive, ignoring the manifest')
+    args = parser.parse_args()
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        stats = walk_on_repo(args.repo, output,
+                             None if args.no_manifest else args.manifest,
+                             args.jobs, args.jsonl, args.with_readme)
+    finally:
+        if args.output:
+            output.close()
+
+    seconds = max(stats['seconds'], 1e-9)
+    extracted_rate = stats['extracted'] / seconds
+    megabytes_rate = stats['bytes'] / 1024 / 1024 / seconds
+    print('{found} archives: {extracted} extracted, {cached} unchanged, '
+          '{errors} errors in {seconds:.2f}s'.format(**stats),
+          file=sys.stderr)
+    print('{:.1f} archives/s, {:.1f} MiB/s extracted'.format(
+        extracted_rate, megabytes_rate), file=sys.stderr)
+
 
 if __name__ == '__main__':
-    walk_on_repo()
+    main()